@@ -0,0 +1,222 @@
+"""Implementation of IVFIndex"""
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+
+from .retrieval import CHUNK_SIZE
+from .retrieval import normalize
+from .retrieval import top_k
+from .store import replacing
+from .store import save_array
+
+FORMAT_VERSION = 1
+
+
+def assign(matrix, centroids, chunk_size=CHUNK_SIZE):
+    """Index of the closest (highest cosine) centroid for every row"""
+    labels = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), chunk_size):
+        end = start + chunk_size
+        chunk = np.asarray(matrix[start:end], dtype=np.float32)
+        labels[start:end] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def list_count(n_lists, n):
+    """Number of lists k-means builds over `n` rows, one row each at most"""
+    return max(min(n_lists, n), 1)
+
+
+def kmeans(matrix, n_lists, n_iter=10, sample_size=None, seed=0):
+    """Spherical k-means over L2-normalized rows
+
+    Centroids are trained on a random sample of at most `sample_size` rows,
+    which is plenty for coarse quantization of a large catalog.
+    """
+    rng = np.random.RandomState(seed)
+    n = len(matrix)
+    n_lists = list_count(n_lists, n)
+    if sample_size is None:
+        sample_size = 256 * n_lists
+
+    sample_idx = np.sort(rng.choice(n, min(sample_size, n), replace=False))
+    sample = np.asarray(matrix[sample_idx], dtype=np.float32)
+
+    init = rng.choice(len(sample), n_lists, replace=False)
+    centroids = sample[init].copy()
+
+    for _ in range(n_iter):
+        labels = assign(sample, centroids)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+
+        # re-seeding empty lists with random rows
+        empty = np.bincount(labels, minlength=n_lists) == 0
+        sums[empty] = sample[rng.choice(len(sample), empty.sum())]
+
+        centroids = normalize(sums)
+
+    return centroids
+
+
+class IVFIndex:
+
+    """Inverted file index with k-means coarse centroids
+
+    Rows of the normalized catalog are grouped by their closest centroid
+    and stored contiguously per list. A search scores the centroids,
+    probes the `nprobe` best lists and ranks only their rows, so `nprobe`
+    trades recall for latency.
+
+    The index is saved as a folder next to the vector store
+    - centroids.npy: (n_lists, dim) normalized centroids
+    - vectors.npy: rows of the catalog, grouped by list
+    - rows.npy: original row index of every grouped row
+    - offsets.npy: start of every list in `vectors.npy`, plus the end
+    - header.json: format version and the version of the source vectors
+    """
+
+    CENTROIDS = "centroids.npy"
+    VECTORS = "vectors.npy"
+    ROWS = "rows.npy"
+    OFFSETS = "offsets.npy"
+    HEADER = "header.json"
+    KIND = "ivf"
+
+    def __init__(self, centroids, vectors, rows, offsets):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.rows = rows
+        self.offsets = offsets
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, n_iter=10, seed=0):
+        """Building the index from an L2-normalized matrix"""
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(matrix)))
+
+        centroids = kmeans(matrix, n_lists, n_iter=n_iter, seed=seed)
+        labels = assign(matrix, centroids)
+
+        rows = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=len(centroids))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        vectors = np.asarray(matrix[rows], dtype=np.float32)
+
+        return cls(centroids, vectors, rows, offsets)
+
+    @staticmethod
+    def header(path):
+        path = os.path.join(path, IVFIndex.HEADER)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "rb") as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT_VERSION:
+            return {}
+        return header
+
+    def save(self, path, **meta):
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        header_path = os.path.join(path, self.HEADER)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+
+        save_array(os.path.join(path, self.CENTROIDS), self.centroids)
+        save_array(os.path.join(path, self.VECTORS), self.vectors)
+        save_array(os.path.join(path, self.ROWS), self.rows)
+        save_array(os.path.join(path, self.OFFSETS), self.offsets)
+
+        # the header is written last and marks the index as complete
+        header = {
+            "format": FORMAT_VERSION,
+            "n_lists": self.n_lists,
+            "n": int(len(self.rows)),
+            **meta,
+        }
+        with replacing(header_path, "w") as f:
+            json.dump(header, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+
+        return cls(
+            np.load(os.path.join(path, cls.CENTROIDS)),
+            load(cls.VECTORS),
+            load(cls.ROWS),
+            np.load(os.path.join(path, cls.OFFSETS)),
+        )
+
+    def state(self):
+        """Arrays and metadata of the index, restored by `from_state`"""
+        arrays = {
+            "centroids": self.centroids,
+            "vectors": self.vectors,
+            "rows": self.rows,
+            "offsets": self.offsets,
+        }
+        return arrays, {"n_lists": self.n_lists}
+
+    @classmethod
+    def from_state(cls, arrays, meta):
+        # the small arrays are read in memory, like `load`
+        return cls(
+            np.array(arrays["centroids"]),
+            arrays["vectors"],
+            arrays["rows"],
+            np.array(arrays["offsets"]),
+        )
+
+    def search(self, query, k, nprobe=8):
+        """Row indices of the approximate top-k rows for a (dim,) query"""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+
+        # probing the closest lists
+        probes = top_k(self.centroids @ query, nprobe)
+
+        rows = []
+        scores = []
+        for p in probes:
+            start, end = self.offsets[p], self.offsets[p + 1]
+            rows.append(self.rows[start:end])
+            scores.append(self.vectors[start:end] @ query)
+
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate(rows)
+        scores = np.concatenate(scores)
+
+        return np.asarray(rows[top_k(scores, k)])
+
+
+def recall_at_k(index, matrix, queries, k, nprobe=8):
+    """Mean recall@k of the index against exact search over `matrix`
+
+    - index: IVFIndex built from `matrix`
+    - matrix: L2-normalized catalog
+    - queries: (n_queries, dim) query vectors
+    """
+    queries = normalize(queries)
+
+    recalls = []
+    for query in queries:
+        exact = top_k(np.asarray(matrix) @ query, k)
+        approx = index.search(query, k, nprobe)
+        if len(exact) == 0:
+            continue
+        recalls.append(len(np.intersect1d(exact, approx)) / len(exact))
+
+    return float(np.mean(recalls)) if recalls else 1.0
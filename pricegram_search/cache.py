@@ -0,0 +1,159 @@
+"""Implementation of Caches"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+def sizeof(obj):
+    """Approximate size in bytes of an object and everything it holds"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sizeof(k) + sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(sizeof(i) for i in obj)
+    return size
+
+
+class LRUCache:
+
+    """Bounded, thread-safe least-recently-used cache with hit counters
+
+    With a `ttl` (seconds) entries also expire that long after being set.
+    With `max_bytes` the approximate size of the cached values is bounded
+    too, the least recently used entries are evicted to stay below it.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, max_bytes=None):
+        assert maxsize > 0
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        item = self._data.get(key)
+        return item is not None and item[0] >= time.monotonic()
+
+    def _remove(self, key):
+        item = self._data.pop(key, MISSING)
+        if item is not MISSING:
+            self.bytes -= item[2]
+        return item
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is not MISSING and item[0] < time.monotonic():
+                self._remove(key)
+                item = MISSING
+            if item is MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, size=None):
+        # `size` in bytes for the values `sizeof` cannot see into
+        expires = float("inf")
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+
+        if self.max_bytes is None:
+            size = 0
+        elif size is None:
+            size = sizeof(value)
+
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (expires, value, size)
+            self.bytes += size
+
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None
+                and self.bytes > self.max_bytes
+                and self._data
+            ):
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._remove(key)
+            return default if item is MISSING else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+        }
+
+
+class TokenizerCache:
+
+    """Memoizing a tokenizer callable, text -> list of tokens
+
+    Query traffic is repetitive and the same keywords show up in every
+    keyword combination, so most texts are tokenized only once.
+    """
+
+    def __init__(self, tokenizer, maxsize=4096):
+        self.tokenizer = tokenizer
+        self.cache = LRUCache(maxsize)
+
+    def __call__(self, text):
+        tokens = self.cache.get(text, MISSING)
+        if tokens is MISSING:
+            tokens = tuple(self.tokenizer(text))
+            self.cache.set(text, tokens)
+        return list(tokens)
+
+    def batch(self, texts):
+        """Tokenizing many texts, only the misses reach the tokenizer"""
+        tokens = [self.cache.get(text, MISSING) for text in texts]
+
+        missing = list(
+            dict.fromkeys(t for t, i in zip(texts, tokens) if i is MISSING)
+        )
+        if missing:
+            batch = getattr(self.tokenizer, "batch", None)
+            if batch is not None:
+                encoded = batch(missing)
+            else:
+                encoded = [self.tokenizer(text) for text in missing]
+
+            encoded = dict(zip(missing, map(tuple, encoded)))
+            for text, i in encoded.items():
+                self.cache.set(text, i)
+
+            tokens = [
+                encoded[t] if i is MISSING else i
+                for t, i in zip(texts, tokens)
+            ]
+
+        return [list(i) for i in tokens]
+
+    def stats(self):
+        return self.cache.stats()
@@ -1,6 +1,10 @@
 """Pipeline Configuration"""
 from __future__ import annotations
 
+# "sha256" of a file artifact is the hex digest its download is verified
+# against, None only checks the size announced by the source and records
+# its digest
+
 CONFIG = [
     {
         "name": "bert_tokenizer",
@@ -13,6 +17,7 @@ CONFIG = [
         "info": {
             "id": "1Nd8B8-D3lAdA57U9JoHjYKp1J73n_TON",
             "path": "vectorizer.pkl",
+            "sha256": None,
         },
     },
     {
@@ -21,6 +26,10 @@ CONFIG = [
         "info": {
             "id": "1-AVJp2NaTgtZOOFmWE5VdRRr5_9fQUX2",
             "path": "vectors.json",
+            "sha256": None,
+            "store": "vectors",
+            "ivf": "vectors_ivf",
+            "sparse": "vectors_sparse",
         },
     },
 ]
@@ -0,0 +1,179 @@
+"""Implementation of CombinationEncoder"""
+from __future__ import annotations
+
+import itertools
+
+import numpy as np
+
+# scipy.sparse is imported by the methods building sparse matrices, it is
+# not needed to import the package
+
+
+class CombinationEncoder:
+
+    """Encoding every combination of keywords with a fitted vectorizer
+
+    The output equals `vectorizer.transform(queries)`, where `queries` are
+    `get_all_combinations(keywords)`, but each keyword is tokenized and
+    counted only once. The term counts of a joined string are the sum of
+    the counts of its keywords, so the combination rows are synthesized by
+    adding counts and reweighting them.
+
+    This only holds for unigram word analyzers, any other vectorizer falls
+    back to encoding the joined strings.
+    """
+
+    def __init__(self, vectorizer):
+        self.vectorizer = vectorizer
+
+    def word(self):
+        vectorizer = self.vectorizer
+        analyzer = getattr(vectorizer, "analyzer", None)
+        return analyzer == "word" and hasattr(vectorizer, "vocabulary_")
+
+    def additive(self):
+        ngram_range = tuple(self.vectorizer.ngram_range)
+        return self.word() and ngram_range == (1, 1)
+
+    def membership(self, columns, n_columns):
+        """(2^n - 1, n_columns) matrix marking the keywords of combinations
+
+        - columns: column of each of the n keywords, keywords repeated
+          across a batch share a column
+        Rows are in the order of `BasicUtils.get_all_combinations`.
+        """
+        import scipy.sparse as sp
+
+        rows = []
+        cols = []
+        i = 0
+        for r in range(1, len(columns) + 1):
+            for combination in itertools.combinations(columns, r):
+                rows.extend([i] * r)
+                cols.extend(combination)
+                i += 1
+        data = np.ones(len(rows), dtype=np.float64)
+        return sp.csr_matrix((data, (rows, cols)), shape=(i, n_columns))
+
+    def tokenize(self, docs):
+        """Tokens of every doc, all docs are tokenized in one batch
+
+        Tokenizers with a `batch` method (the BERT tokenizer and its cache)
+        encode every doc in a single call to the fast tokenizer backend.
+        """
+        vectorizer = self.vectorizer
+        preprocess = vectorizer.build_preprocessor()
+        docs = [preprocess(vectorizer.decode(doc)) for doc in docs]
+
+        batch = getattr(vectorizer.tokenizer, "batch", None)
+        if batch is not None:
+            return batch(docs)
+
+        tokenize = vectorizer.build_tokenizer()
+        return [tokenize(doc) for doc in docs]
+
+    def counts(self, docs):
+        """Raw term counts, `binary` is applied after the counts are added
+
+        Same as the vectorizer's analyzer followed by counting the terms
+        of the fitted vocabulary, but fed with pre-tokenized docs.
+        """
+        import scipy.sparse as sp
+
+        vectorizer = self.vectorizer
+        vocabulary = vectorizer.vocabulary_
+        stop_words = vectorizer.get_stop_words()
+
+        values = []
+        indices = []
+        indptr = [0]
+        for tokens in self.tokenize(docs):
+            counter = {}
+            for term in vectorizer._word_ngrams(tokens, stop_words):
+                i = vocabulary.get(term)
+                if i is not None:
+                    counter[i] = counter.get(i, 0) + 1
+            indices.extend(counter.keys())
+            values.extend(counter.values())
+            indptr.append(len(indices))
+
+        return sp.csr_matrix(
+            (values, indices, indptr),
+            shape=(len(indptr) - 1, len(vocabulary)),
+            dtype=vectorizer.dtype,
+        )
+
+    def weight(self, counts):
+        """Applying the vectorizer's transform on top of raw term counts"""
+        vectorizer = self.vectorizer
+
+        # matching the index order of the vectorizer, so that the row norms
+        # are summed in the same order and results are identical
+        counts.sort_indices()
+
+        if vectorizer.binary:
+            counts.data.fill(1)
+
+        tfidf = getattr(vectorizer, "_tfidf", None)
+        if tfidf is not None:
+            return tfidf.transform(counts, copy=False)
+        return counts
+
+    def encode(self, docs, batch_size=1024):
+        """Same as `vectorizer.transform(docs)`, tokenizing docs in batches
+
+        Used for the queries and for offline re-vectorization of the
+        whole catalog.
+        """
+        import scipy.sparse as sp
+
+        if not self.word():
+            return self.vectorizer.transform(docs)
+
+        docs = list(docs)
+        if not docs:
+            return sp.csr_matrix((0, len(self.vectorizer.vocabulary_)))
+
+        chunks = []
+        for start in range(0, len(docs), batch_size):
+            end = start + batch_size
+            chunks.append(self.weight(self.counts(docs[start:end])))
+
+        return sp.csr_matrix(sp.vstack(chunks))
+
+    def transform(self, keywords, queries):
+        """Encoding `queries`, the joined combinations of `keywords`"""
+        encoded, _ = self.transform_many([keywords], [queries])
+        return encoded
+
+    def transform_many(self, keywords_list, queries_list):
+        """Encoding the queries of many keyword lists in one pass
+
+        Every distinct keyword of the batch is tokenized and counted once.
+        Returns the stacked encoded queries and the row offsets of every
+        keyword list, rows of list i are `offsets[i]:offsets[i + 1]`.
+        """
+        import scipy.sparse as sp
+
+        offsets = np.cumsum([0] + [len(i) for i in queries_list])
+
+        if not self.additive():
+            queries = [q for queries in queries_list for q in queries]
+            return self.encode(queries), offsets
+
+        # distinct keywords of the whole batch, in order of appearance
+        columns = {}
+        for keywords in keywords_list:
+            for keyword in keywords:
+                columns.setdefault(keyword, len(columns))
+
+        membership = sp.vstack(
+            [
+                self.membership([columns[i] for i in keywords], len(columns))
+                for keywords in keywords_list
+            ]
+        )
+
+        counts = membership @ self.counts(list(columns))
+        counts = counts.astype(self.vectorizer.dtype, copy=False)
+        return self.weight(sp.csr_matrix(counts)), offsets
@@ -1,23 +1,98 @@
 """Implementation of Search Engine"""
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import functools
+import inspect
+import threading
 import warnings
 
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
+from .cache import LRUCache
+from .loader import fn_preprocessor
 from .loader import Initializer
+from .products import map_products
+from .products import ProductCache
+from .products import ProductTextIndex
+from .ranker import ProcessRanker
+from .retrieval import centroid
+from .retrieval import normalize
+from .retrieval import top_k
+from .segments import DeltaSegment
+from .shards import ShardedIndex
 from .utils import ProductsMatch
 
 warnings.filterwarnings("ignore")
 
+# keyword lists scored per matmul by `search_many`, bounding the size of
+# the (QUERY_BATCH, n_products) score matrix
+QUERY_BATCH = 64
+
 
 class Pipeline(Initializer, ProductsMatch):
+    # upserted and deleted products, see `SearchEngine.upsert`
+    delta = None
+    ann = None
+
     def pipe(self, **data):
+        pipes = {
+            "Retrieval": self.retrieval_pipe,
+            "Sorter": self.sorter_pipe,
+        }
+
+        for pipe_name, pipe in pipes.items():
+            data = pipe(**data)
+
+        return data
+
+    def retrieval_pipe(self, **data):
         pipes = {
             "Vectorizer": self.vectorizer_pipe,
             "Cluster": self.cluster_pipe,
-            "Sorter": self.sorter_pipe,
+        }
+
+        # reusing the retrieved ids of an identical earlier search
+        ids_key = self.cache_key(data["keywords"], data["k"])
+        ids = None
+        if self.ids_cache is not None:
+            ids = self.ids_cache.get(ids_key)
+        if ids is not None:
+            return {
+                "queries": self.get_all_combinations(data["keywords"]),
+                "ids": ids,
+                **data,
+            }
+
+        for pipe_name, pipe in pipes.items():
+            data = pipe(**data)
+
+        if self.ids_cache is not None:
+            self.ids_cache.set(ids_key, data["ids"])
+
+        return data
+
+    def cache_key(self, keywords, *args):
+        # searches the vectorizer reads as the same text give same results,
+        # its preprocessor drops tabs and newlines (joining the words around
+        # them), its uncased tokenizer ignores case and repeated spaces
+        keywords = tuple(
+            " ".join(fn_preprocessor(i).lower().split()) for i in keywords
+        )
+        return (keywords, *args)
+
+    def invalidate(self):
+        # cached results of the previous artifacts are outdated
+        for cache in (self.ids_cache, self.results_cache):
+            if cache is not None:
+                cache.clear()
+
+    def pipe_many(self, **data):
+        pipes = {
+            "Vectorizer": self.vectorizer_many_pipe,
+            "Cluster": self.cluster_many_pipe,
+            "Sorter": self.sorter_many_pipe,
         }
 
         for pipe_name, pipe in pipes.items():
@@ -34,8 +109,13 @@ class Pipeline(Initializer, ProductsMatch):
         # queries = [query.strip().lower() for query in data['keywords']]
         queries = self.get_all_combinations(data["keywords"])
 
-        # encoding textual queries to number vector
-        encoded = self.vectorizer.transform(queries).toarray()
+        # encoding textual queries to number vector, each keyword is
+        # tokenized once and the combinations are built from its counts
+        encoded = self.encoder.transform(data["keywords"], queries)
+
+        # the inverted index scores the sparse vectors directly
+        if self.index != "sparse":
+            encoded = encoded.toarray()
 
         return {
             "queries": queries,
@@ -43,20 +123,111 @@ class Pipeline(Initializer, ProductsMatch):
             **data,
         }
 
-    def cluster_pipe(self, **data):
-        # calculating scores
-        similarity_scores = cosine_similarity(
-            data["encoded"], self.vectors["vectors"]
-        )
+    def view(self):
+        # main vectors, their index and a view of the delta segment, which
+        # compaction swaps together
+        lock = getattr(self, "segments_lock", None)
+        if lock is None:
+            lock = contextlib.nullcontext()
+        with lock:
+            delta = self.delta
+            if delta is not None:
+                delta = delta.view()
+            return self.vectors, self.ann, delta
+
+    def scores(self, encoded, matrix=None):
+        """Mean cosine score of the queries against the whole catalog
+
+        - matrix: normalized rows to score, defaults to the catalog
+        """
+        if matrix is None:
+            matrix = self.vectors["normalized"]
 
-        # sorting arguments by score
-        idx = np.argsort(-similarity_scores.mean(axis=0))
+        if self.scoring == "centroid":
+            # scoring the mean query once, a single 1 x N matvec
+            return (centroid(encoded) @ matrix.T)[0]
 
-        # selecting top-k
-        idx = idx[: data["k"]]
+        # scoring every query, the catalog is normalized once at load
+        return (normalize(encoded) @ matrix.T).mean(axis=0)
 
-        # getting product ids by vector index
-        ids = [self.vectors["ids"][i] for i in idx]
+    def search_index(self, encoded, k, vectors=None, ann=None):
+        """Row indices of the top-k products for the encoded queries"""
+        if vectors is None:
+            vectors, ann = self.vectors, self.ann
+
+        if self.index == "ivf":
+            # approximate search, probing `nprobe` lists of the index
+            query = centroid(encoded)[0]
+            return ann.search(query, k, self.nprobe)
+
+        if self.index == "sparse":
+            # scoring only the postings of the query terms
+            return ann.search(encoded, k)
+
+        # selecting top-k, sorted by score
+        return top_k(self.scores(encoded, vectors["normalized"]), k)
+
+    def shard_query(self, encoded):
+        # shards average the scores of the rows of a query group
+        if self.scoring == "centroid":
+            return centroid(encoded)
+        return normalize(encoded)
+
+    def search_segments(self, encoded, k, vectors, ann, delta):
+        """Ids of the top-k products of the main vectors and the delta
+
+        Tombstoned rows of the main vectors are filtered out, so enough
+        extra rows are retrieved to still fill `k`. The survivors and the
+        delta rows are scored alike and merged.
+        """
+        n = k + len(delta)
+        if self.index == "sharded":
+            ids, scores = ann.search([self.shard_query(encoded)], n)[0]
+        else:
+            idx = self.search_index(encoded, n, vectors, ann)
+            ids = np.asarray(vectors["ids"])[idx]
+
+        # filtering the tombstones
+        alive = delta.alive(ids)
+        ids = ids[alive]
+
+        if self.index == "sparse":
+            encoded = encoded.toarray()
+        if self.index == "sharded":
+            scores = scores[alive]
+        else:
+            matrix = np.asarray(vectors["normalized"])[idx[alive]]
+            scores = self.scores(encoded, matrix)
+
+        rows = delta.rows()
+        delta_scores = self.scores(encoded, delta.normalized[rows])
+        delta_ids = [delta.ids[i] for i in rows]
+        if self.index == "sparse":
+            # same as the index, only products sharing a term
+            matching = np.flatnonzero(delta_scores > 0)
+            delta_scores = delta_scores[matching]
+            delta_ids = [delta_ids[i] for i in matching]
+
+        candidates = ids.tolist() + delta_ids
+        order = top_k(np.concatenate([scores, delta_scores]), k)
+        return [candidates[i] for i in order]
+
+    def cluster_pipe(self, **data):
+        vectors, ann, delta = self.view()
+
+        if delta:
+            ids = self.search_segments(
+                data["encoded"], data["k"], vectors, ann, delta
+            )
+        elif self.index == "sharded":
+            # merging the top-k of every shard
+            query = self.shard_query(data["encoded"])
+            ids = ann.search([query], data["k"])[0][0].tolist()
+        else:
+            idx = self.search_index(data["encoded"], data["k"], vectors, ann)
+
+            # getting product ids by vector index
+            ids = vectors["ids"][idx].tolist()
 
         return {
             "ids": ids,
@@ -67,13 +238,90 @@ class Pipeline(Initializer, ProductsMatch):
         c = data["cluster_size"]
 
         # fetching the data
-        products = self.data_fetcher(data["ids"])
+        products = self.fetch(data["ids"])
 
         # cleaning queries
         queries = [self.clean_zero(i) for i in data["queries"]]
 
+        # sorting, with the sources of the scores when explaining
+        products, sources = self.sort_clusters(
+            products, queries, c, data.get("explain", False)
+        )
+
+        return {
+            "products": products,
+            "sources": sources,
+            **data,
+        }
+
+    def split_clusters(self, ids, c):
+        # slices of `c` ids, fetched and sorted one at a time
+        clusters = []
+        for start in range(0, len(ids), c):
+            end = start + c
+            clusters.append(ids[start:end])
+        return clusters
+
+    def take_clusters(self, products, c, last=False):
+        """Clusters of `c` fetched products, and the products left over
+
+        The slices are the ones of `sort_clusters`, ids dropped by the
+        data fetcher do not shrink a cluster. The products left over wait
+        for the next fetch, or form the last cluster with `last`.
+        """
+        n = len(products) if last else len(products) - len(products) % c
+        return self.split_clusters(products[:n], c), products[n:]
+
+    def fetch_map(self, ids):
+        """id -> product for the ids that exist, through the product cache"""
+        if self.product_cache is not None:
+            return self.product_cache.fetch_map(ids, self.data_fetcher)
+        return map_products(ids, self.data_fetcher(ids), self.id_key)
+
+    def fetch(self, ids):
+        """Products of `ids`, in the order of `ids`"""
+        products = self.fetch_map(ids)
+        return [products[i] for i in ids if i in products]
+
+    async def async_fetch(self, ids, data_fetcher, executor=None, cache=True):
+        """Products of `ids` in order, from an async or a sync data_fetcher
+
+        A sync `data_fetcher` is run in the executor, so it never blocks
+        the event loop. With `cache=False` the product cache is not used.
+        """
+        product_cache = self.product_cache if cache else None
+        products, missing = {}, list(dict.fromkeys(ids))
+        if product_cache is not None:
+            products, missing = product_cache.lookup(ids)
+
+        if missing:
+            is_async = inspect.iscoroutinefunction(
+                data_fetcher
+            ) or inspect.iscoroutinefunction(
+                getattr(data_fetcher, "__call__", None)
+            )
+            if is_async:
+                fetched = await data_fetcher(missing)
+            else:
+                loop = asyncio.get_running_loop()
+                fetched = await loop.run_in_executor(
+                    executor, data_fetcher, missing
+                )
+
+            fetched = map_products(missing, fetched, self.id_key)
+            if product_cache is not None:
+                product_cache.add(fetched)
+            products.update(fetched)
+
+        return [products[i] for i in ids if i in products]
+
+    def sort_clusters(self, products, queries, c, explain=False):
+        if self.ranker is not None and not explain:
+            return self.sort_clusters_many([products], [queries], c)[0], None
+
         # creating splits based on cluster size
         sorted_products = []
+        sources = [] if explain else None
         for i in range(0, len(products), c):
             start_i = i
             end_i = start_i + c
@@ -82,15 +330,130 @@ class Pipeline(Initializer, ProductsMatch):
             products_batch = products[start_i:end_i]
 
             # sorting batch
-            products_batch, score, source = self.sort_products(
-                products_batch, queries
+            products_batch, score, source = self.sort_products_batch(
+                products_batch, queries, explain
             )
 
             # adding batch
             sorted_products.extend(products_batch)
+            if explain:
+                sources.extend(source)
+
+        return sorted_products, sources
+
+    def sort_clusters_many(self, products_list, queries_list, c):
+        """`sort_clusters` of many product lists, sharing the process pool
+
+        With a `ranker` the clusters of every list are spread across the
+        worker processes, and merged back in cluster order.
+        """
+        if self.ranker is None:
+            return [
+                self.sort_clusters(products, queries, c)[0]
+                for products, queries in zip(products_list, queries_list)
+            ]
+
+        # creating splits of every list based on cluster size
+        batches = []
+        owners = []
+        for n, (products, queries) in enumerate(
+            zip(products_list, queries_list)
+        ):
+            for start in range(0, len(products), c):
+                end = start + c
+                batches.append((products[start:end], queries))
+                owners.append(n)
+
+        sorted_products = [[] for _ in products_list]
+        for n, (batch, scores) in zip(owners, self.ranker.sort(batches)):
+            sorted_products[n].extend(batch)
+
+        return sorted_products
+
+    def vectorizer_many_pipe(self, **data):
+        queries = [self.get_all_combinations(i) for i in data["keywords"]]
+
+        # encoding the queries of all keyword lists in one pass
+        encoded, offsets = self.encoder.transform_many(
+            data["keywords"], queries
+        )
+
+        # the inverted index scores the sparse vectors directly
+        if self.index != "sparse":
+            encoded = encoded.toarray()
+
+        return {
+            "queries": queries,
+            "encoded": encoded,
+            "offsets": offsets,
+            **data,
+        }
+
+    def cluster_many_pipe(self, **data):
+        encoded = data["encoded"]
+        k = data["k"]
+        segments = list(zip(data["offsets"][:-1], data["offsets"][1:]))
+        vectors, ann, delta = self.view()
+
+        if delta:
+            ids = [
+                self.search_segments(encoded[s:e], k, vectors, ann, delta)
+                for s, e in segments
+            ]
+            return {
+                "ids": ids,
+                **data,
+            }
+
+        if self.index == "sharded":
+            # one scatter-gather for every keyword list
+            queries = [self.shard_query(encoded[s:e]) for s, e in segments]
+            results = ann.search(queries, k)
+            return {
+                "ids": [ids.tolist() for ids, scores in results],
+                **data,
+            }
+
+        if self.index != "exact" or self.scoring != "centroid":
+            idx = [
+                self.search_index(encoded[s:e], k, vectors, ann)
+                for s, e in segments
+            ]
+        else:
+            # scoring the centroids of many keyword lists with one matmul
+            matrix = vectors["normalized"]
+            queries = np.vstack([centroid(encoded[s:e]) for s, e in segments])
+            idx = []
+            for start in range(0, len(queries), QUERY_BATCH):
+                end = start + QUERY_BATCH
+                scores = queries[start:end] @ matrix.T
+                idx.extend(top_k(i, k) for i in scores)
+
+        # getting product ids by vector index
+        ids = [vectors["ids"][i].tolist() for i in idx]
 
         return {
-            "products": sorted_products,
+            "ids": ids,
+            **data,
+        }
+
+    def sorter_many_pipe(self, **data):
+        c = data["cluster_size"]
+
+        # fetching the union of the ids of all keyword lists once
+        union = list(dict.fromkeys(i for ids in data["ids"] for i in ids))
+        fetched = self.fetch_map(union)
+
+        # splitting the products per keyword list
+        products = [
+            [fetched[i] for i in ids if i in fetched] for ids in data["ids"]
+        ]
+
+        # cleaning queries
+        queries = [[self.clean_zero(i) for i in q] for q in data["queries"]]
+
+        return {
+            "products": self.sort_clusters_many(products, queries, c),
             **data,
         }
 
@@ -99,17 +462,280 @@ class SearchEngine(Pipeline):
 
     """Downloading and Loading the Utils and Recommending based on keywords"""
 
-    def __init__(self, data_fetcher, dump_path, skip_init=False, verbose=1):
-        """Downloading and Loading the Utils"""
+    def __init__(
+        self,
+        data_fetcher,
+        dump_path,
+        skip_init=False,
+        verbose=1,
+        scoring="centroid",
+        index="exact",
+        nprobe=8,
+        n_lists=None,
+        n_shards=4,
+        tokenizer_cache_size=4096,
+        cache_size=0,
+        cache_ttl=300,
+        product_index_size=0,
+        product_cache_size=0,
+        product_cache_ttl=300,
+        product_cache_bytes=None,
+        id_key="id",
+        workers=0,
+        source=None,
+        download_workers=4,
+        compact_size=0,
+    ):
+        """Downloading and Loading the Utils
+
+        - scoring: "centroid" scores the mean of the keyword combination
+          vectors once, "mean" scores every combination and averages the
+          scores. Both give the same ranking up to float tolerance.
+        - index: "exact" scores the whole catalog, "ivf" builds (once) and
+          searches an approximate IVF index saved next to the vectors,
+          "sparse" builds (once) and searches a term -> product inverted
+          index, returning only products that share a term with the query.
+          "sharded" splits the catalog across `n_shards` worker processes
+          and merges their exact top-k.
+        - nprobe: number of IVF lists searched per query, higher values
+          trade latency for recall.
+        - n_lists: number of IVF lists, defaults to sqrt(n_products).
+        - n_shards: number of shards of the "sharded" index.
+        - tokenizer_cache_size: number of tokenized texts memoized by the
+          LRU tokenizer cache, 0 disables it. Hit/miss counters are
+          available from `tokenizer_cache.stats()`.
+        - cache_size: number of searches whose results are cached, 0
+          disables the result caches. The retrieved ids are cached per
+          (keywords, k) and the final ordering per (keywords, k,
+          cluster_size), both are cleared when `init` loads new artifacts.
+        - cache_ttl: seconds after which a cached result expires, None
+          keeps results until they are evicted.
+        - product_index_size: number of products whose cleaned text is
+          kept by id (the "id" key of fetched products) for the sorter, 0
+          disables it.
+        - product_cache_size: number of product documents cached in front
+          of `data_fetcher`, 0 disables it. Only missing ids are fetched.
+        - product_cache_ttl: seconds after which a cached product expires.
+        - product_cache_bytes: approximate memory budget of the product
+          cache, None for no budget.
+        - id_key: key of the product id in the products returned by
+          `data_fetcher`, used to keep the order of the requested ids.
+          Products without it are assumed to be returned in that order.
+        - workers: number of processes re-ranking the clusters of `search`
+          and `search_many`, 0 sorts them in the calling thread. The pool
+          is started once, `close()` stops it.
+        - source: where the artifacts are downloaded from, None for Google
+          Drive, or a local directory, "file://" or "http(s)://" mirror
+          holding the files under their config "path".
+        - download_workers: number of artifacts downloaded concurrently.
+        - compact_size: number of products changed by `upsert` and
+          `delete` after which the delta segment is merged into the main
+          vectors in the background, 0 only merges on `compact()`.
+
+        Changed products are dropped from the product caches with
+        `invalidate_products(ids)`.
+        """
+
+        assert scoring in ("centroid", "mean")
+        assert index in ("exact", "ivf", "sparse", "sharded")
 
         super().__init__()
 
         self.dump_path = dump_path
         self.data_fetcher = data_fetcher
+        self.scoring = scoring
+        self.index = index
+        self.nprobe = nprobe
+        self.n_lists = n_lists
+        self.n_shards = n_shards
+        self.tokenizer_cache_size = tokenizer_cache_size
+        self.source = source
+        self.download_workers = download_workers
+
+        # result caches, retrieval ids and final ordering
+        self.ids_cache = None
+        self.results_cache = None
+        if cache_size:
+            self.ids_cache = LRUCache(cache_size, cache_ttl)
+            self.results_cache = LRUCache(cache_size, cache_ttl)
+
+        # cleaned product text for the sorter, filled by fetched products
+        self.id_key = id_key
+        if product_index_size:
+            self.product_index = ProductTextIndex(
+                self.cleaned_parts, product_index_size, id_key
+            )
+
+        # product documents, read through in front of `data_fetcher`
+        self.product_cache = None
+        if product_cache_size:
+            self.product_cache = ProductCache(
+                product_cache_size,
+                product_cache_ttl,
+                product_cache_bytes,
+                id_key,
+            )
+
+        # products changed since the vectors were loaded
+        self.compact_size = compact_size
+        self.compaction = None
+        # sharded index replaced by the last compaction
+        self.retired = None
+        self.segments_lock = threading.Lock()
+        self.writes_lock = threading.Lock()
+        self.compact_lock = threading.Lock()
+
+        # worker processes sorting the clusters, started once
+        self.ranker = None
+        if workers:
+            self.ranker = ProcessRanker(self, workers)
 
         # loading the utilities in memory
         self.init(skip_init, verbose)
 
+    def upsert(self, ids, texts):
+        """Adding or replacing products, searchable right away
+
+        - ids: product ids
+        - texts: product texts, vectorized with the loaded vectorizer the
+          same way as the catalog
+
+        The vectors are appended to a delta segment searched next to the
+        main vectors, and replace the rows of the same ids.
+        """
+        assert len(ids) == len(texts)
+
+        vectors = self.encoder.encode(texts).toarray()
+        assert vectors.shape[1] == self.vectors["vectors"].shape[1]
+
+        with self.writes_lock:
+            if self.delta is None:
+                self.delta = DeltaSegment(vectors.shape[1])
+            with self.segments_lock:
+                self.delta.upsert(ids, vectors)
+            size = len(self.delta)
+
+        self.changed(ids, size)
+
+    def delete(self, ids):
+        """Removing products from the results, by tombstoning their ids"""
+        with self.writes_lock:
+            if self.delta is None:
+                dim = self.vectors["vectors"].shape[1]
+                self.delta = DeltaSegment(dim)
+            with self.segments_lock:
+                self.delta.delete(ids)
+            size = len(self.delta)
+
+        self.changed(ids, size)
+
+    def changed(self, ids, size):
+        # cached results and products of the changed ids are outdated
+        self.invalidate()
+        self.invalidate_products(ids)
+
+        # `size` is read with the write, a compaction may reset the delta
+        if self.compact_size and size >= self.compact_size:
+            self.compact(wait=False)
+
+    def compact(self, wait=True):
+        """Merging the delta segment into the main vectors
+
+        The changes up to now are merged and the "ivf", "sparse" or
+        "sharded" index is rebuilt while searches and writes go on, then
+        the new vectors are swapped in with the writes made meanwhile as
+        the new delta. Vectors loaded from the dump folder are written
+        back to their store (and index) and memory-mapped again. With
+        `wait=False` the merge runs in a background thread, which is
+        returned.
+        """
+        if not wait:
+            if self.compaction is None or not self.compaction.is_alive():
+                self.compaction = threading.Thread(
+                    target=self.compact, daemon=True
+                )
+                self.compaction.start()
+            return self.compaction
+
+        with self.compact_lock:
+            vectors, ann, delta = self.view()
+            if not delta:
+                return
+
+            # merging the changes of the view, writes are not blocked
+            vectors = self.save_vectors(delta.merge(vectors))
+            if self.index in ("ivf", "sparse"):
+                ann = self.build_index(vectors["normalized"])
+            elif self.index == "sharded":
+                ann = ShardedIndex(
+                    vectors["normalized"], vectors["ids"], self.n_shards
+                )
+            # the index of vectors written back to the store is saved too
+            mapped = isinstance(vectors["normalized"], np.memmap)
+            if self.index in ("ivf", "sparse") and mapped:
+                self.save_index(ann)
+
+            # keeping the writes made during the merge
+            with self.writes_lock:
+                rebased = self.delta.rebase(delta.generation)
+                with self.segments_lock:
+                    old_ann = self.ann
+                    self.vectors = vectors
+                    self.ann = ann
+                    self.delta = rebased if len(rebased) else None
+
+            if self.index == "sharded":
+                # searches may still hold the replaced index, it is stopped
+                # on the next swap
+                retired, self.retired = self.retired, old_ann
+                if retired is not None:
+                    retired.close()
+
+        self.invalidate()
+
+    @classmethod
+    def from_snapshot(cls, path, data_fetcher, verbose=1, **kwargs):
+        """Search engine loaded from a snapshot written by `save_snapshot`
+
+        - path: snapshot file
+        - data_fetcher: same as `SearchEngine`
+        - kwargs: other arguments of `SearchEngine`
+
+        Nothing is downloaded, converted or unpickled. The vectors are
+        memory-mapped from the snapshot and the tokenizer is restored
+        with `tokenizers`, without importing transformers.
+        """
+        engine = cls(data_fetcher, None, skip_init=True, **kwargs)
+        engine.init_snapshot(path, verbose)
+        return engine
+
+    def close(self):
+        """Stopping the worker processes, if any"""
+        if self.ranker is not None:
+            self.ranker.close()
+            self.ranker = None
+        if isinstance(self.ann, ShardedIndex):
+            self.ann.close()
+            self.ann = None
+        if self.retired is not None:
+            self.retired.close()
+            self.retired = None
+
+    def invalidate_products(self, ids=None):
+        """Dropping changed products from the product caches
+
+        - ids: ids of the changed products, None drops every product
+        Cached search results are cleared too, their ordering may be
+        outdated. The cleaned text of a changed product is rebuilt when
+        it is fetched anyway, dropping it only frees it early.
+        """
+        if self.product_cache is not None:
+            self.product_cache.invalidate(ids)
+        if self.product_index is not None:
+            self.product_index.invalidate(ids)
+        if self.results_cache is not None:
+            self.results_cache.clear()
+
     def search(self, keywords, cluster_size: int = 50, k: int = 100):
         """
         Recommends products based on keywords.
@@ -148,10 +774,223 @@ class SearchEngine(Pipeline):
         if cluster_size > k:
             cluster_size = k
 
+        key = self.cache_key(keywords, k, cluster_size)
+        if self.results_cache is not None:
+            products = self.results_cache.get(key)
+            if products is not None:
+                return list(products)
+
         results = self.pipe(
             keywords=keywords,
             cluster_size=cluster_size,
             k=k,
         )
 
+        if self.results_cache is not None:
+            self.results_cache.set(key, results["products"])
+
+        return list(results["products"])
+
+    def search_many(self, keywords_list, cluster_size: int = 50, k: int = 100):
+        """
+        Recommends products for many keyword lists at once.
+
+        All keyword lists are vectorized in one pass and scored together,
+        and `data_fetcher` is called once with the union of the ids.
+
+        Parameters:
+        - keywords_list (List[List[str]]): Keyword lists, one per search.
+        - cluster_size (int, optional): Size of clusters used for sorting.
+          Defaults to 50.
+        - k (int, optional): Number of products to fetch per keyword list.
+          Defaults to 100.
+
+        Returns:
+        - List[List[Dict[str, Any]]]: Recommended products for every
+          keyword list, in the order of `keywords_list`.
+        """
+
+        # Validating the inputs
+        assert isinstance(keywords_list, list)
+        assert len(keywords_list) > 0
+        for keywords in keywords_list:
+            assert isinstance(keywords, list)
+            assert len(keywords) > 0
+            assert isinstance(keywords[0], str)
+        assert isinstance(cluster_size, int)
+        assert isinstance(k, int)
+
+        # Implementation
+
+        if cluster_size > k:
+            cluster_size = k
+
+        results = self.pipe_many(
+            keywords=keywords_list,
+            cluster_size=cluster_size,
+            k=k,
+        )
+
         return results["products"]
+
+    def search_iter(self, keywords, cluster_size: int = 50, k: int = 100):
+        """
+        Recommends products based on keywords, one cluster at a time.
+
+        Parameters:
+        - keywords, cluster_size, k: same as `search`.
+
+        Yields:
+        - List[Dict[str, Any]]: The sorted products of every cluster, in
+          the order of `search`.
+
+        Note:
+        - `data_fetcher` is called once per cluster of ids, and a cluster
+          is yielded as soon as its products are fetched and sorted. Time
+          to the first cluster does not depend on `k`.
+        - Clusters not consumed are never fetched.
+        """
+
+        # Validating the inputs
+        assert isinstance(keywords, list)
+        assert len(keywords) > 0
+        assert isinstance(keywords[0], str)
+        assert isinstance(cluster_size, int)
+        assert isinstance(k, int)
+
+        # Implementation
+
+        if cluster_size > k:
+            cluster_size = k
+
+        key = self.cache_key(keywords, k, cluster_size)
+        if self.results_cache is not None:
+            products = self.results_cache.get(key)
+            if products is not None:
+                yield from self.split_clusters(products, cluster_size)
+                return
+
+        data = self.retrieval_pipe(
+            keywords=keywords,
+            cluster_size=cluster_size,
+            k=k,
+        )
+
+        queries = [self.clean_zero(i) for i in data["queries"]]
+
+        products = []
+        fetched = []
+        ids_list = self.split_clusters(data["ids"], cluster_size)
+        for i, ids in enumerate(ids_list):
+            # fetching only this cluster, sorting the full ones
+            fetched.extend(self.fetch(ids))
+            clusters, fetched = self.take_clusters(
+                fetched, cluster_size, last=i + 1 == len(ids_list)
+            )
+
+            for batch in clusters:
+                batch, score, source = self.sort_products_batch(batch, queries)
+                products.extend(batch)
+                yield list(batch)
+
+        if self.results_cache is not None:
+            self.results_cache.set(key, products)
+
+    async def async_search(
+        self,
+        keywords,
+        cluster_size: int = 50,
+        k: int = 100,
+        data_fetcher=None,
+        executor=None,
+    ):
+        """
+        Recommends products based on keywords, without blocking the loop.
+
+        Parameters:
+        - keywords, cluster_size, k: same as `search`.
+        - data_fetcher (optional): async (or sync) function of the ids,
+          defaults to the engine's `data_fetcher`. Results and products
+          of another data_fetcher are not cached.
+        - executor (optional): `concurrent.futures.Executor` running the
+          CPU stages, defaults to the loop's default executor.
+
+        Returns:
+        - List[Dict[str, Any]]: Same as `search`.
+
+        Note:
+        - Tokenization, scoring and sorting run in the executor.
+        - Products are fetched one cluster at a time, the fetch of cluster
+          i + 1 overlaps with the sorting of cluster i.
+        """
+
+        # Validating the inputs
+        assert isinstance(keywords, list)
+        assert len(keywords) > 0
+        assert isinstance(keywords[0], str)
+        assert isinstance(cluster_size, int)
+        assert isinstance(k, int)
+
+        # Implementation
+
+        if cluster_size > k:
+            cluster_size = k
+        # caches are filled by the engine's data_fetcher only
+        cache = data_fetcher is None
+        if data_fetcher is None:
+            data_fetcher = self.data_fetcher
+        results_cache = self.results_cache if cache else None
+        loop = asyncio.get_running_loop()
+
+        key = self.cache_key(keywords, k, cluster_size)
+        if results_cache is not None:
+            products = results_cache.get(key)
+            if products is not None:
+                return list(products)
+
+        # vectorizing and retrieving off the event loop
+        data = await loop.run_in_executor(
+            executor,
+            functools.partial(
+                self.retrieval_pipe,
+                keywords=keywords,
+                cluster_size=cluster_size,
+                k=k,
+            ),
+        )
+
+        queries = [self.clean_zero(i) for i in data["queries"]]
+        ids_list = self.split_clusters(data["ids"], cluster_size)
+
+        def fetch(i):
+            return asyncio.ensure_future(
+                self.async_fetch(ids_list[i], data_fetcher, executor, cache)
+            )
+
+        products = []
+        fetched = []
+        fetching = fetch(0) if ids_list else None
+        try:
+            for i in range(len(ids_list)):
+                fetched.extend(await fetching)
+
+                # fetching the next cluster while this one is sorted
+                last = i + 1 == len(ids_list)
+                fetching = None if last else fetch(i + 1)
+
+                clusters, fetched = self.take_clusters(
+                    fetched, cluster_size, last
+                )
+                for batch in clusters:
+                    batch, score, source = await loop.run_in_executor(
+                        executor, self.sort_products_batch, batch, queries
+                    )
+                    products.extend(batch)
+        finally:
+            if fetching is not None and not fetching.done():
+                fetching.cancel()
+
+        if results_cache is not None:
+            results_cache.set(key, products)
+
+        return list(products)
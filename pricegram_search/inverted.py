@@ -0,0 +1,167 @@
+"""Implementation of InvertedIndex"""
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+
+from .retrieval import CHUNK_SIZE
+from .retrieval import top_k
+from .store import replacing
+from .store import save_array
+
+FORMAT_VERSION = 1
+
+# scipy.sparse is imported by the functions building sparse matrices, it
+# is not needed to import the package
+
+
+def sparse_centroid(encoded):
+    """Mean of the L2-normalized rows of a sparse matrix, as a (1, V) CSR"""
+    import scipy.sparse as sp
+
+    encoded = sp.csr_matrix(encoded, dtype=np.float32)
+    norms = np.sqrt(np.asarray(encoded.multiply(encoded).sum(axis=1)))
+    norms = norms.reshape(-1)
+    norms[norms == 0] = 1
+
+    weights = sp.csr_matrix(1 / norms / len(norms), dtype=np.float32)
+    return sp.csr_matrix(weights @ encoded)
+
+
+class InvertedIndex:
+
+    """Term -> product inverted index over the normalized TF-IDF catalog
+
+    The catalog is kept in CSC layout, so the postings of a term are the
+    non-zero rows of its column. A query only touches the postings of its
+    own non-zero terms instead of every product. Only products sharing at
+    least one term with the query are returned.
+
+    The index is saved as a folder next to the vector store
+    - indptr.npy, indices.npy, data.npy: the CSC arrays
+    - header.json: format version, shape and the version of the vectors
+    """
+
+    INDPTR = "indptr.npy"
+    INDICES = "indices.npy"
+    DATA = "data.npy"
+    HEADER = "header.json"
+    KIND = "sparse"
+
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = tuple(shape)
+
+    @classmethod
+    def build(cls, matrix, chunk_size=CHUNK_SIZE):
+        """Building the index from a dense, L2-normalized matrix"""
+        import scipy.sparse as sp
+
+        chunks = []
+        for start in range(0, len(matrix), chunk_size):
+            end = start + chunk_size
+            chunk = np.asarray(matrix[start:end])
+            chunks.append(sp.csr_matrix(chunk, dtype=np.float32))
+
+        if chunks:
+            csc = sp.vstack(chunks).tocsc()
+        else:
+            csc = sp.csc_matrix(matrix.shape, dtype=np.float32)
+        csc.sort_indices()
+
+        return cls(csc.indptr, csc.indices, csc.data, csc.shape)
+
+    @staticmethod
+    def header(path):
+        path = os.path.join(path, InvertedIndex.HEADER)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "rb") as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT_VERSION:
+            return {}
+        return header
+
+    def save(self, path, **meta):
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        header_path = os.path.join(path, self.HEADER)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+
+        save_array(os.path.join(path, self.INDPTR), self.indptr)
+        save_array(os.path.join(path, self.INDICES), self.indices)
+        save_array(os.path.join(path, self.DATA), self.data)
+
+        # the header is written last and marks the index as complete
+        header = {
+            "format": FORMAT_VERSION,
+            "shape": list(self.shape),
+            "nnz": int(len(self.data)),
+            **meta,
+        }
+        with replacing(header_path, "w") as f:
+            json.dump(header, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+
+        return cls(
+            np.load(os.path.join(path, cls.INDPTR)),
+            load(cls.INDICES),
+            load(cls.DATA),
+            cls.header(path)["shape"],
+        )
+
+    def state(self):
+        """Arrays and metadata of the index, restored by `from_state`"""
+        arrays = {
+            "indptr": self.indptr,
+            "indices": self.indices,
+            "data": self.data,
+        }
+        return arrays, {"shape": list(self.shape)}
+
+    @classmethod
+    def from_state(cls, arrays, meta):
+        # the small arrays are read in memory, like `load`
+        return cls(
+            np.array(arrays["indptr"]),
+            arrays["indices"],
+            arrays["data"],
+            meta["shape"],
+        )
+
+    def scores(self, query):
+        """Rows sharing a term with a (1, V) sparse query, and their scores"""
+        import scipy.sparse as sp
+
+        query = sp.csr_matrix(query)
+
+        rows = []
+        values = []
+        for term, weight in zip(query.indices, query.data):
+            start, end = self.indptr[term], self.indptr[term + 1]
+            rows.append(self.indices[start:end])
+            values.append(self.data[start:end] * weight)
+
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, np.float32)
+
+        # accumulating the postings per product
+        rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(values))
+
+        return rows, scores
+
+    def search(self, encoded, k):
+        """Row indices of the top-k rows for the centroid of `encoded`"""
+        rows, scores = self.scores(sparse_centroid(encoded))
+        return rows[top_k(scores, k)]
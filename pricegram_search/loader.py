@@ -1,15 +1,27 @@
 """Implementation of Initializer"""
 from __future__ import annotations
 
+import concurrent.futures
 import json
 import os
 import re
+import threading
 
-import gdown
-import joblib
-from transformers import BertTokenizerFast
+import numpy as np
 
+from .ann import IVFIndex
+from .ann import list_count
+from .cache import TokenizerCache
 from .config import CONFIG
+from .encoder import CombinationEncoder
+from .inverted import InvertedIndex
+from .retrieval import normalize
+from .shards import ShardedIndex
+from .snapshot import Snapshot
+from .sources import get_source
+from .sources import remove_parts
+from .sources import sha256
+from .store import VectorStore
 
 
 class Utils:
@@ -19,69 +31,285 @@ class Utils:
     def get_path(self, path):
         return os.path.join(self.dump_path, path)
 
-    def drive_download(self, id, path):
-        gdown.download(
-            f"https://drive.google.com/uc?id={id}", path, quiet=False
+
+class Tokenizer:
+
+    """text -> tokens callable over a fast (Rust backed) BERT tokenizer
+
+    `batch` encodes many texts in one call, so the backend can tokenize
+    them in parallel instead of one Python call per text.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def __call__(self, text):
+        return self.tokenizer.convert_ids_to_tokens(
+            self.tokenizer.encode(text, add_special_tokens=False)
         )
 
+    def batch(self, texts):
+        if not texts:
+            return []
+        encoded = self.tokenizer(list(texts), add_special_tokens=False)
+        return [
+            self.tokenizer.convert_ids_to_tokens(ids)
+            for ids in encoded["input_ids"]
+        ]
+
+    def state(self):
+        """tokenizer.json of the backend, restored by `BackendTokenizer`"""
+        return self.tokenizer.backend_tokenizer.to_str()
+
+
+class BackendTokenizer:
+
+    """text -> tokens callable over a `tokenizers` Tokenizer
+
+    Same tokens as `Tokenizer`, restored from a tokenizer.json state
+    without importing transformers.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    @classmethod
+    def from_state(cls, state):
+        from tokenizers import Tokenizer as FastTokenizer
+
+        return cls(FastTokenizer.from_str(state))
+
+    def __call__(self, text):
+        return self.tokenizer.encode(text, add_special_tokens=False).tokens
+
+    def batch(self, texts):
+        if not texts:
+            return []
+        encoded = self.tokenizer.encode_batch(
+            list(texts), add_special_tokens=False
+        )
+        return [i.tokens for i in encoded]
+
+    def state(self):
+        return self.tokenizer.to_str()
+
 
 class Downloader(Utils):
+
+    """Downloading the artifacts of the config, concurrently
+
+    - source: where files are fetched from, see `sources.get_source`
+    - workers: number of artifacts downloaded at the same time
+
+    Interrupted downloads are resumed from their ".part" file. Files with
+    a "sha256" in their config entry are verified after downloading,
+    files without one are checked against the size announced by the
+    source. The size, mtime and hash of every verified file are kept in
+    `files.json`, so unchanged files are not hashed again, and files
+    without a "sha256" are later verified against the recorded hash.
+    """
+
+    MANIFEST = "files.json"
+
+    def __init__(self, dump_path, source=None, workers=4):
+        super().__init__(dump_path)
+        self.source = get_source(source)
+        self.workers = workers
+        self._lock = threading.Lock()
+
+        self.manifest = {}
+        if os.path.exists(self.get_path(self.MANIFEST)):
+            with open(self.get_path(self.MANIFEST), "rb") as f:
+                self.manifest = json.load(f)
+
+    def save_manifest(self):
+        with open(self.get_path(self.MANIFEST), "w") as f:
+            json.dump(self.manifest, f)
+
+    def verify(self, info):
+        """Whether the downloaded artifact is present and intact"""
+        path = self.get_path(info["path"])
+        if "id" not in info:
+            # directories written by their own library
+            return os.path.exists(path)
+        if not os.path.isfile(path):
+            return False
+
+        stat = os.stat(path)
+        expected = info.get("sha256")
+        with self._lock:
+            entry = self.manifest.get(info["path"], {})
+        if expected is None:
+            # the hash recorded right after the file was downloaded
+            expected = entry.get("sha256")
+        if (
+            entry.get("size") == stat.st_size
+            and entry.get("mtime") == stat.st_mtime_ns
+            and expected in (None, entry.get("sha256"))
+        ):
+            return True
+
+        digest = sha256(path)
+        if expected is not None and digest != expected:
+            return False
+
+        with self._lock:
+            self.manifest[info["path"]] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "sha256": digest,
+            }
+            self.save_manifest()
+        return True
+
+    def download(self, dumps):
+        """Downloading the artifacts of many config entries concurrently"""
+        if not dumps:
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            futures = [
+                pool.submit(getattr(self, dump["name"]), dump["info"])
+                for dump in dumps
+            ]
+            for future in futures:
+                future.result()
+
+    def forget(self, info):
+        """Dropping the recorded size, mtime and hash of a file"""
+        with self._lock:
+            if self.manifest.pop(info["path"], None) is not None:
+                self.save_manifest()
+
+    def discard(self, info):
+        """Removing a downloaded file and its parts, of an older version"""
+        path = self.get_path(info["path"])
+        if os.path.isfile(path):
+            os.remove(path)
+        remove_parts(path)
+        self.forget(info)
+
+    def fetch(self, info):
+        path = self.get_path(info["path"])
+        if os.path.exists(path):
+            os.remove(path)
+        # the file downloaded now is the one recorded
+        self.forget(info)
+
+        # a damaged file is downloaded again once, from scratch
+        for attempt in range(2):
+            size = self.source.fetch(info, path)
+            if size is not None and os.path.getsize(path) != size:
+                os.remove(path)
+                continue
+            if self.verify(info):
+                return
+            os.remove(path)
+
+        raise ValueError(f"size or checksum mismatch: {info['path']}")
+
     def bert_tokenizer(self, info):
+        from transformers import BertTokenizerFast
+
         path = self.get_path(info["path"])
         tokenizer = BertTokenizerFast.from_pretrained(info["name"])
         tokenizer.save_pretrained(path)
 
     def vectorizer(self, info):
-        self.drive_download(
-            path=self.get_path(info["path"]),
-            id=info["id"],
-        )
+        self.fetch(info)
 
     def vectors(self, info):
-        self.drive_download(
-            path=self.get_path(info["path"]),
-            id=info["id"],
-        )
+        self.fetch(info)
 
 
 class Loader(Utils):
     def bert_tokenizer(self, info):
+        from transformers import BertTokenizerFast
+
         path = self.get_path(info["path"])
         tokenizer = BertTokenizerFast.from_pretrained(path)
-        return lambda text: tokenizer.convert_ids_to_tokens(
-            tokenizer.encode(text, add_special_tokens=False)
-        )
+        return Tokenizer(tokenizer)
 
     def vectorizer(self, info):
+        import joblib
+
         path = self.get_path(info["path"])
         return joblib.load(path)
 
     def vectors(self, info):
-        path = self.get_path(info["path"])
-        with open(path, "rb") as f:
-            return json.load(f)
+        store = VectorStore(self.get_path(info["store"]))
+        return store.read()
+
+
+class Converter(Utils):
+    def stale(self, name, info, v, downloaded=False):
+        """Whether the store of an artifact must be converted again
+
+        A source downloaded again is always converted, its content may
+        differ from the one the store was converted from.
+        """
+        if "store" not in info:
+            return False
+        if downloaded:
+            return True
+        store = VectorStore(self.get_path(info["store"]))
+        return store.header().get("v") != v
+
+    def vectors(self, info, v):
+        store = VectorStore(self.get_path(info["store"]))
+        store.convert_json(self.get_path(info["path"]), v=v)
+
+
+def get_info_headline(x, name, v):
+    return f" {x} {name} [v:{v}] ".join(["=" * 20] * 2)
+
+
+def fn_preprocessor(x):
+    return re.sub(r"[^0-9a-zA-Z ]", "", x)
 
 
 class Initializer:
     def __init__(self):
         self.dump_path = None
         self.config = CONFIG
+        self.index = "exact"
+        self.n_lists = None
+        self.n_shards = 4
+        self.tokenizer_cache_size = 4096
+        self.source = None
+        self.download_workers = 4
+        self.versions = {}
+
+    def invalidate(self):
+        """Called when `init` loads a new version of any artifact"""
 
     def post_init(self):
+        # memoizing the tokenization of repeated keywords
+        self.tokenizer_cache = None
         self.vectorizer.tokenizer = self.bert_tokenizer
-
-        def fn_preprocessor(x):
-            return re.sub(r"[^0-9a-zA-Z ]", "", x)
+        if self.tokenizer_cache_size:
+            self.tokenizer_cache = TokenizerCache(
+                self.bert_tokenizer, self.tokenizer_cache_size
+            )
+            self.vectorizer.tokenizer = self.tokenizer_cache
 
         self.vectorizer.preprocessor = fn_preprocessor
+        self.encoder = CombinationEncoder(self.vectorizer)
+
+        # vectors that were not read from a store are normalized here
+        if "normalized" not in self.vectors:
+            self.vectors["normalized"] = normalize(self.vectors["vectors"])
 
     def init(self, skip_init, verbose):
         if skip_init:
             return
 
         # 0. Initializers
-        self.downloader = Downloader(self.dump_path)
+        self.downloader = Downloader(
+            self.dump_path, self.source, self.download_workers
+        )
         self.loader = Loader(self.dump_path)
+        self.converter = Converter(self.dump_path)
 
         # 1. Creating Dump Folder
         root = self.dump_path
@@ -96,30 +324,200 @@ class Initializer:
         else:
             versions = {}
 
-        # 3. Downloading  and Loading Utils
-        def get_info_headline(x):
-            return f" {x} {name} [v:{v}] ".join(["=" * 20] * 2)
+        # 3. Downloading new or damaged Utils, concurrently
+        downloads = []
+        for dump in self.config:
+            name, v, info = list(dump.values())
+            if versions.get(name) != v:
+                # parts of an older version must not be resumed
+                self.downloader.discard(info)
+            elif "store" in info and not self.converter.stale(name, info, v):
+                # the converted store is loaded, its source is not needed
+                continue
+            elif self.downloader.verify(info):
+                continue
+            if verbose:
+                print(get_info_headline("Downloading", name, v))
+            downloads.append(dump)
+        self.downloader.download(downloads)
+        downloaded = {dump["name"] for dump in downloads}
 
+        # 4. Converting and Loading Utils
         for dump in self.config:
             name, v, info = list(dump.values())
 
-            # DOWNLOADING
-            if versions.get(name) != v:
+            # CONVERTING
+            if self.converter.stale(name, info, v, name in downloaded):
                 if verbose:
-                    print(get_info_headline("Downloading"))
-                getattr(self.downloader, name)(info)
+                    print(get_info_headline("Converting", name, v))
+                getattr(self.converter, name)(info, v)
 
             # LOADING
             if verbose:
-                print(get_info_headline("Loading"))
+                print(get_info_headline("Loading", name, v))
             setattr(self, name, getattr(self.loader, name)(info))
 
             # Saving Version of dump
             versions[name] = v
 
-        # 4. Saving Latest Versions
+        # 5. Saving Latest Versions
         with open(version_file_path, "w") as f:
             json.dump(versions, f)
 
-        # 5. Post Iniit
+        if versions != self.versions:
+            self.invalidate()
+        self.versions = versions
+
+        # 6. Post Iniit
         self.post_init()
+
+        # 7. Building and Loading the optional retrieval index
+        if self.index != "exact":
+            self.init_index(verbose)
+
+    def save_snapshot(self, path):
+        """Writing the loaded artifacts to one snapshot file at `path`
+
+        The snapshot holds the vectorizer's vocabulary and idf, the state
+        of the fast tokenizer, the vectors and the "ivf" or "sparse"
+        index, see `init_snapshot`.
+        """
+        tokenizer = getattr(self, "bert_tokenizer", None)
+        state = getattr(tokenizer, "state", None)
+
+        index = None
+        if self.index in ("ivf", "sparse"):
+            index = self.ann
+
+        # products upserted or deleted since loading are kept
+        vectors = self.vectors
+        delta = getattr(self, "delta", None)
+        if delta is not None:
+            vectors = delta.view().merge(vectors)
+            if index is not None:
+                index = self.build_index(vectors["normalized"])
+
+        Snapshot(path).write(
+            self.vectorizer,
+            vectors,
+            tokenizer_state=state() if state is not None else None,
+            index=index,
+            versions=self.versions,
+        )
+
+    def init_snapshot(self, path, verbose):
+        """Loading the artifacts from a snapshot instead of `init`
+
+        Nothing is downloaded or converted, the vectors and the index are
+        mapped from the snapshot file. Without a tokenizer state in the
+        snapshot the vectorizer's own tokenizer is used, without a
+        matching index the index is built, over the whole catalog.
+        """
+        if verbose:
+            print(get_info_headline("Loading", "snapshot", path))
+
+        snapshot = Snapshot(path).read()
+
+        self.vectorizer = snapshot["vectorizer"]
+        self.vectors = snapshot["vectors"]
+        if snapshot["tokenizer_state"] is not None:
+            self.bert_tokenizer = BackendTokenizer.from_state(
+                snapshot["tokenizer_state"]
+            )
+        else:
+            self.bert_tokenizer = self.vectorizer.build_tokenizer()
+
+        versions = snapshot["header"].get("versions", {})
+        if versions != self.versions:
+            self.invalidate()
+        self.versions = versions
+
+        self.post_init()
+
+        index = snapshot["index"]
+        if self.index == "sharded":
+            self.init_shards()
+        elif self.index in ("ivf", "sparse"):
+            if (
+                index is not None
+                and index["kind"] == self.index
+                and not self.index_stale(index)
+            ):
+                index_class = {"ivf": IVFIndex, "sparse": InvertedIndex}
+                self.ann = index_class[self.index].from_state(
+                    index["arrays"], index
+                )
+            else:
+                # the index is built in memory, there is no dump folder
+                self.ann = self.build_index(self.vectors["normalized"])
+
+    def save_vectors(self, vectors):
+        """Writing vectors over the loaded store and mapping them again
+
+        Vectors that were not mapped from the dump folder (a snapshot, or
+        set in memory) are kept in memory.
+        """
+        mapped = isinstance(self.vectors["normalized"], np.memmap)
+        if self.dump_path is None or not mapped:
+            return vectors
+
+        dump = {i["name"]: i for i in self.config}["vectors"]
+        store = VectorStore(
+            os.path.join(self.dump_path, dump["info"]["store"])
+        )
+        store.write(vectors["vectors"], vectors["ids"], v=dump["v"])
+        return store.read()
+
+    def save_index(self, index):
+        """Saving a rebuilt "ivf" or "sparse" index next to the vectors"""
+        dump = {i["name"]: i for i in self.config}["vectors"]
+        index.save(
+            os.path.join(self.dump_path, dump["info"][self.index]),
+            v=dump["v"],
+        )
+
+    def build_index(self, matrix):
+        """ "ivf" or "sparse" index over normalized vectors"""
+        if self.index == "ivf":
+            return IVFIndex.build(matrix, self.n_lists)
+        return InvertedIndex.build(matrix)
+
+    def index_stale(self, header):
+        # an "ivf" index of another number of lists than asked for, k-means
+        # builds fewer lists than rows
+        if self.index != "ivf" or self.n_lists is None:
+            return False
+        n_lists = list_count(self.n_lists, len(self.vectors["normalized"]))
+        return header.get("n_lists") != n_lists
+
+    def init_shards(self):
+        # stopping the shards of previously loaded vectors
+        if isinstance(getattr(self, "ann", None), ShardedIndex):
+            self.ann.close()
+        self.ann = ShardedIndex(
+            self.vectors["normalized"], self.vectors["ids"], self.n_shards
+        )
+
+    def init_index(self, verbose):
+        """Building the retrieval index next to the vectors, once per version
+
+        - "ivf": IVFIndex, approximate search over k-means lists
+        - "sparse": InvertedIndex, term -> product postings
+        - "sharded": ShardedIndex, started from the loaded vectors
+        """
+        if self.index == "sharded":
+            self.init_shards()
+            return
+
+        dump = {i["name"]: i for i in self.config}["vectors"]
+        path = os.path.join(self.dump_path, dump["info"][self.index])
+        index_class = {"ivf": IVFIndex, "sparse": InvertedIndex}[self.index]
+
+        header = index_class.header(path)
+        if header.get("v") != dump["v"] or self.index_stale(header):
+            if verbose:
+                print(get_info_headline("Building", self.index, dump["v"]))
+            index = self.build_index(self.vectors["normalized"])
+            index.save(path, v=dump["v"])
+
+        self.ann = index_class.load(path)
@@ -0,0 +1,127 @@
+"""Implementation of SuffixAutomaton"""
+from __future__ import annotations
+
+from .cache import LRUCache
+
+
+class SuffixAutomaton:
+
+    """Suffix automaton of a text, built in O(len(text))
+
+    Every path from the initial state spells a substring of the text, so
+    the longest prefix of `pattern[start:]` occurring in the text is found
+    by following transitions until one is missing.
+    """
+
+    __slots__ = ("next",)
+
+    def __init__(self, text):
+        nxt = [{}]
+        link = [-1]
+        length = [0]
+        last = 0
+
+        for ch in text:
+            cur = len(nxt)
+            nxt.append({})
+            link.append(0)
+            length.append(length[last] + 1)
+
+            p = last
+            while p != -1 and ch not in nxt[p]:
+                nxt[p][ch] = cur
+                p = link[p]
+
+            if p != -1:
+                q = nxt[p][ch]
+                if length[p] + 1 == length[q]:
+                    link[cur] = q
+                else:
+                    clone = len(nxt)
+                    nxt.append(dict(nxt[q]))
+                    link.append(link[q])
+                    length.append(length[p] + 1)
+                    while p != -1 and nxt[p].get(ch) == q:
+                        nxt[p][ch] = clone
+                        p = link[p]
+                    link[q] = clone
+                    link[cur] = clone
+
+            last = cur
+
+        self.next = nxt
+
+    def longest_prefix(self, pattern, start):
+        """End of the longest `pattern[start:end]` occurring in the text"""
+        nxt = self.next
+        state = 0
+        end = start
+        while end < len(pattern):
+            state = nxt[state].get(pattern[end])
+            if state is None:
+                break
+            end += 1
+        return end
+
+    def find_matching_parts(self, pattern):
+        """Greedy longest-match segmentation of `pattern` against the text
+
+        Each step costs the length of the match it finds (or one step when
+        nothing matches), so a pattern is segmented in O(len(pattern)).
+        """
+        matched_parts = []
+        start = 0
+        while start < len(pattern):
+            end = self.longest_prefix(pattern, start)
+            if end > start:
+                matched_parts.append(pattern[start:end])
+                start = end
+            else:
+                start += 1
+        return matched_parts
+
+
+def scan_matching_parts(text, pattern):
+    """Same segmentation as `SuffixAutomaton.find_matching_parts`, by
+    substring scans of the text, O(len(pattern) ** 2 * len(text)) but
+    without building anything
+    """
+    matched_parts = []
+    start = 0
+    while start < len(pattern):
+        for end in range(len(pattern), start, -1):
+            if pattern[start:end] in text:
+                matched_parts.append(pattern[start:end])
+                start = end
+                break
+        else:
+            start += 1
+    return matched_parts
+
+
+# approximate size of an automaton per character of its text
+AUTOMATON_BYTES = 450
+# automata kept by a process, about 70k characters of text
+automata = LRUCache(maxsize=1 << 16, max_bytes=32 << 20)
+# how often the texts without an automaton were matched, by hash
+matches = LRUCache(maxsize=1 << 16)
+
+
+def find_matching_parts(text, pattern):
+    automaton = automata.get(text)
+    if automaton is not None:
+        return automaton.find_matching_parts(pattern)
+
+    # an automaton is only worth building for a text matched often, it
+    # costs about as much as one substring scan of the text per 64
+    # characters, while most product parts are matched once or twice
+    key = hash(text)
+    count = matches.get(key, 0) + 1
+    if count < 2 + len(text) // 64:
+        matches.set(key, count)
+        return scan_matching_parts(text, pattern)
+
+    matches.pop(key)
+    automaton = SuffixAutomaton(text)
+    automata.set(text, automaton, size=AUTOMATON_BYTES * len(text))
+    return automaton.find_matching_parts(pattern)
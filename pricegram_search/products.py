@@ -0,0 +1,158 @@
+"""Implementation of ProductTextIndex and ProductCache"""
+from __future__ import annotations
+
+import sys
+
+from .cache import LRUCache
+
+
+def map_products(ids, products, id_key="id"):
+    """id -> product, for the products fetched for `ids`
+
+    Products are matched by their `id_key` when every product carries one
+    of the requested ids, otherwise `data_fetcher` is assumed to return
+    them in the order of `ids`.
+    """
+    requested = set(ids)
+    mapped = {}
+    for product in products:
+        id_ = product.get(id_key) if isinstance(product, dict) else None
+        if id_ not in requested:
+            return dict(zip(ids, products))
+        mapped[id_] = product
+    return mapped
+
+
+def fingerprint(product):
+    # several times cheaper than cleaning the parts of the product
+    return hash(repr(product))
+
+
+class ProductText:
+
+    """Cleaned parts of one product, interned to share repeated parts
+
+    The fingerprint of the product they were cleaned from is kept, to
+    detect a product whose text changed.
+    """
+
+    __slots__ = ("parts", "fingerprint")
+
+    def __init__(self, parts, fingerprint=None):
+        self.parts = tuple(sys.intern(i) for i in parts)
+        self.fingerprint = fingerprint
+
+
+class ProductTextIndex:
+
+    """Product id -> cleaned parts, as matched by the sorter
+
+    - cleaner: product -> list of cleaned parts, following the list/dict/
+      scalar rules of `ProductsMatch.product_parts`
+    - maxsize: number of products kept, least recently used are evicted
+    - id_key: key of the product id in the fetched products, products
+      without it are cleaned on every call
+
+    Filled lazily from the products given to `parts`, or in bulk with
+    `add`. A record is only reused for a product with the same
+    fingerprint, an updated product is cleaned again. `invalidate` only
+    frees the records of changed products early.
+    """
+
+    def __init__(self, cleaner, maxsize=100000, id_key="id"):
+        self.cleaner = cleaner
+        self.id_key = id_key
+        self.records = LRUCache(maxsize)
+
+    def __len__(self):
+        return len(self.records)
+
+    def parts(self, product):
+        id_ = product.get(self.id_key)
+        if id_ is None:
+            return self.cleaner(product)
+
+        key = fingerprint(product)
+        record = self.records.get(id_)
+        if record is None or record.fingerprint != key:
+            record = ProductText(self.cleaner(product), key)
+            self.records.set(id_, record)
+        return record.parts
+
+    def add(self, products):
+        for product in products:
+            id_ = product.get(self.id_key)
+            if id_ is not None:
+                record = ProductText(
+                    self.cleaner(product), fingerprint(product)
+                )
+                self.records.set(id_, record)
+
+    def invalidate(self, ids=None):
+        """Dropping the given product ids, or every product"""
+        if ids is None:
+            self.records.clear()
+            return
+        for id_ in ids:
+            self.records.pop(id_)
+
+    def stats(self):
+        return self.records.stats()
+
+
+class ProductCache:
+
+    """Read-through cache of product documents in front of `data_fetcher`
+
+    Only the ids missing from the cache are fetched, in one bulk call.
+    Entries are evicted by LRU, after `ttl` seconds and to keep the
+    approximate size of the cached products below `max_bytes`.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300, max_bytes=None, id_key="id"):
+        self.id_key = id_key
+        self.products = LRUCache(maxsize, ttl, max_bytes)
+
+    def lookup(self, ids):
+        """Cached products of `ids` (id -> product), and the missing ids"""
+        products = {}
+        missing = []
+        for id_ in dict.fromkeys(ids):
+            product = self.products.get(id_)
+            if product is None:
+                missing.append(id_)
+            else:
+                products[id_] = product
+        return products, missing
+
+    def add(self, products):
+        """Caching fetched products, id -> product"""
+        for id_, product in products.items():
+            self.products.set(id_, product)
+
+    def fetch_map(self, ids, data_fetcher):
+        """id -> product for the ids that exist"""
+        products, missing = self.lookup(ids)
+
+        if missing:
+            fetched = map_products(missing, data_fetcher(missing), self.id_key)
+            self.add(fetched)
+            products.update(fetched)
+
+        return products
+
+    def fetch(self, ids, data_fetcher):
+        """Products of `ids`, in the order of `ids`"""
+        products = self.fetch_map(ids, data_fetcher)
+        return [products[i] for i in ids if i in products]
+
+    def invalidate(self, ids=None):
+        """Dropping the given product ids, or every product"""
+        if ids is None:
+            self.products.clear()
+            return
+        for id_ in ids:
+            self.products.pop(id_)
+
+    def stats(self):
+        return self.products.stats()
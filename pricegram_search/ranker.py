@@ -0,0 +1,85 @@
+"""Implementation of ProcessRanker"""
+from __future__ import annotations
+
+import concurrent.futures
+
+import numpy as np
+
+from .utils import ProductsMatch
+
+# cleaned parts only hold [0-9a-z], so they are joined around a NUL
+SEPARATOR = "\x00"
+
+# matcher of a worker process, its automaton cache lives as long as it
+_matcher = None
+
+
+def pack(parts, counts):
+    """Compact form of the flat parts of a cluster, one string + counts"""
+    counts = np.asarray(counts, dtype=np.int32)
+    return SEPARATOR.join(parts), counts.tobytes()
+
+
+def unpack(joined, counts):
+    counts = np.frombuffer(counts, dtype=np.int32).astype(np.int64)
+    parts = joined.split(SEPARATOR) if counts.sum() else []
+    return parts, counts
+
+
+def rank(task):
+    """Order and scores of a packed cluster, run in a worker process"""
+    global _matcher
+    if _matcher is None:
+        _matcher = ProductsMatch()
+
+    joined, counts, keywords = task
+    parts, counts = unpack(joined, counts)
+    idx, scores = _matcher.rank_parts(parts, counts, keywords)
+
+    return np.asarray(idx, dtype=np.int32).tobytes(), scores
+
+
+class ProcessRanker:
+
+    """Re-ranking clusters of products in a pool of worker processes
+
+    - matcher: ProductsMatch flattening the products, its `product_index`
+      is used in the calling process
+    - workers: number of worker processes
+
+    Only the cleaned parts of a cluster are sent to a worker, packed into
+    one string, and only the sorted order comes back. The product
+    documents never leave the calling process. The pool is started once
+    and reused by every call, until `close`.
+    """
+
+    def __init__(self, matcher, workers):
+        assert workers > 0
+
+        self.matcher = matcher
+        self.workers = workers
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers)
+
+    def sort(self, batches):
+        """Sorted products and scores of every (products, keywords) batch
+
+        Results are returned in the order of `batches`.
+        """
+        tasks = []
+        for products, keywords in batches:
+            parts, counts = self.matcher.flatten_parts(products)
+            tasks.append((*pack(parts, counts), keywords))
+
+        # a few tasks per message, while keeping every worker busy
+        chunksize = max(len(tasks) // (4 * self.workers), 1)
+
+        results = []
+        ranked = self.pool.map(rank, tasks, chunksize=chunksize)
+        for (products, keywords), (idx, scores) in zip(batches, ranked):
+            idx = np.frombuffer(idx, dtype=np.int32)
+            results.append(([products[i] for i in idx], scores))
+
+        return results
+
+    def close(self):
+        self.pool.shutdown()
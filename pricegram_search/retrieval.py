@@ -0,0 +1,56 @@
+"""Implementation of Retrieval helpers"""
+from __future__ import annotations
+
+import numpy as np
+
+CHUNK_SIZE = 65536
+
+
+def normalize(matrix, chunk_size=CHUNK_SIZE):
+    """L2-normalizing the rows of a matrix into a new float32 array
+
+    Rows with zero norm are left as zeros, same as sklearn's `normalize`.
+    The work is done in chunks so that a large memory-mapped matrix never
+    needs a full float64 copy.
+    """
+    matrix = np.asarray(matrix)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+
+    normalized = np.empty(matrix.shape, dtype=np.float32)
+    for start in range(0, len(matrix), chunk_size):
+        end = start + chunk_size
+        chunk = np.asarray(matrix[start:end], dtype=np.float32)
+        norms = np.sqrt(np.einsum("ij,ij->i", chunk, chunk))
+        norms[norms == 0] = 1
+        np.divide(chunk, norms[:, None], out=normalized[start:end])
+    return normalized
+
+
+def centroid(encoded):
+    """Mean of the L2-normalized query vectors, as a (1, dim) matrix
+
+    Cosine similarity is linear in the normalized query, so averaging the
+    scores of several queries equals scoring their centroid once.
+    """
+    return normalize(encoded).mean(axis=0, keepdims=True)
+
+
+def top_k(scores, k):
+    """Indices of the `k` highest scores, sorted by descending score
+
+    `argpartition` selects the winners in linear time, and only those
+    `k` indices are sorted afterwards.
+    """
+    scores = np.asarray(scores)
+    n = len(scores)
+    k = max(min(k, n), 0)
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < n:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+
+    return idx[np.argsort(-scores[idx], kind="stable")]
@@ -0,0 +1,188 @@
+"""Implementation of DeltaSegment"""
+from __future__ import annotations
+
+import numpy as np
+
+from .retrieval import normalize
+
+# generation of the rows and tombstones that are still alive
+ALIVE = np.iinfo(np.int64).max
+
+
+class DeltaView:
+
+    """Products upserted and deleted as of one generation of a segment
+
+    - vectors, normalized: rows appended up to the generation, dead rows
+      included
+    - ids: product id of every row
+    - generation: writes after it are not visible
+
+    Later writes only append rows past the view, or mark rows dead with a
+    later generation, so a view never changes under a search. The
+    tombstones are copied, a view is read without the segment's locks.
+    """
+
+    def __init__(self, segment):
+        n = segment.n
+        self.vectors = segment.vectors[:n]
+        self.normalized = segment.normalized[:n]
+        self.ids = segment.ids
+        self.generation = segment.generation
+        self.deleted = dict(segment.deleted)
+        self._dead = segment.dead[:n]
+
+    def __len__(self):
+        # tombstones of the main vectors
+        return len(self.deleted)
+
+    def rows(self):
+        """Rows that are alive in this view"""
+        return np.flatnonzero(self._dead > self.generation)
+
+    def alive(self, ids):
+        """Mask of the main vector ids that are not tombstoned"""
+        deleted = self.deleted
+        return np.fromiter(
+            (i not in deleted for i in np.asarray(ids).tolist()),
+            dtype=bool,
+            count=len(ids),
+        )
+
+    def merge(self, vectors):
+        """Main vectors with the changes of the view applied
+
+        Rows of the main vectors are kept in their order, followed by the
+        alive rows of the view.
+        """
+        tombstones = np.array(list(self.deleted))
+        alive = ~np.isin(np.asarray(vectors["ids"]), tombstones)
+        rows = self.rows()
+
+        ids = np.asarray(vectors["ids"])[alive]
+        if len(rows):
+            ids = np.concatenate(
+                [ids, np.asarray([self.ids[i] for i in rows])]
+            )
+
+        return {
+            "vectors": np.vstack(
+                [np.asarray(vectors["vectors"])[alive], self.vectors[rows]]
+            ),
+            "ids": ids,
+            "normalized": np.vstack(
+                [
+                    np.asarray(vectors["normalized"])[alive],
+                    self.normalized[rows],
+                ]
+            ),
+        }
+
+
+class DeltaSegment:
+
+    """Products upserted and deleted since the main vectors were loaded
+
+    Upserted rows are appended to buffers that grow by doubling, so a
+    write costs the size of its batch. Replaced and deleted rows are not
+    removed, they are marked dead with the generation of the write, and
+    the ids they shadow in the main vectors are tombstoned the same way.
+
+    Writes must be serialized by the caller, searches read a `view()`.
+    """
+
+    def __init__(self, dim, capacity=1024):
+        capacity = max(capacity, 1)
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.normalized = np.empty((capacity, dim), dtype=np.float32)
+        self.dead = np.full(capacity, ALIVE, dtype=np.int64)
+        self.n = 0
+        self.ids = []
+        self.generation = 0
+
+        # id -> alive row, first generation the id is tombstoned in the
+        # main vectors, and last generation it was written
+        self.rows = {}
+        self.deleted = {}
+        self.changed = {}
+
+    def __len__(self):
+        # changes held by the segment, compared to the main vectors
+        return len(self.deleted)
+
+    def view(self):
+        return DeltaView(self)
+
+    def reserve(self, n):
+        capacity = len(self.vectors)
+        if n <= capacity:
+            return
+        while capacity < n:
+            capacity *= 2
+
+        # new buffers, views keep reading the old ones
+        for name, fill in [("vectors", 0), ("normalized", 0), ("dead", ALIVE)]:
+            old = getattr(self, name)
+            new = np.full((capacity, *old.shape[1:]), fill, dtype=old.dtype)
+            new[: self.n] = old[: self.n]
+            setattr(self, name, new)
+
+    def kill(self, id_, generation):
+        row = self.rows.pop(id_, None)
+        if row is not None:
+            self.dead[row] = generation
+        self.deleted.setdefault(id_, generation)
+        self.changed[id_] = generation
+
+    def upsert(self, ids, vectors):
+        """Adding or replacing the rows of `ids`, returns the segment"""
+        ids = list(ids)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        assert len(ids) == len(vectors)
+
+        # the last row of an id repeated in the batch wins
+        last = {id_: i for i, id_ in enumerate(ids)}
+        batch = sorted(last.values())
+
+        start = self.n
+        end = start + len(batch)
+        self.reserve(end)
+        self.vectors[start:end] = vectors[batch]
+        self.normalized[start:end] = normalize(vectors[batch])
+
+        generation = self.generation + 1
+        for row, i in enumerate(batch, start):
+            self.kill(ids[i], generation)
+            self.rows[ids[i]] = row
+            self.ids.append(ids[i])
+
+        # publishing the rows and the generation last
+        self.n = end
+        self.generation = generation
+        return self
+
+    def delete(self, ids):
+        """Removing the products of `ids`, returns the segment"""
+        generation = self.generation + 1
+        for id_ in ids:
+            self.kill(id_, generation)
+        self.generation = generation
+        return self
+
+    def rebase(self, generation):
+        """New segment holding only the writes made after `generation`
+
+        Used once the changes up to `generation` are merged in the main
+        vectors.
+        """
+        segment = DeltaSegment(self.vectors.shape[1])
+        for id_, g in self.changed.items():
+            if g <= generation:
+                continue
+            row = self.rows.get(id_)
+            if row is None:
+                segment.delete([id_])
+            else:
+                end = row + 1
+                segment.upsert([id_], self.vectors[row:end])
+        return segment
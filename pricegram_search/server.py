@@ -0,0 +1,171 @@
+"""Implementation of PreforkServer"""
+from __future__ import annotations
+
+import gc
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def share_array(array):
+    """Read-only copy of an array in shared memory, and its memory block"""
+    array = np.ascontiguousarray(array)
+    if array.dtype.kind == "O":
+        # object arrays can not live in shared memory
+        array = array.astype(str)
+
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, array.dtype, buffer=block.buf)
+    shared[...] = array
+    shared.flags.writeable = False
+    return shared, block
+
+
+def share_vectors(vectors):
+    """Vectors whose in-memory arrays are moved to shared memory
+
+    Memory-mapped arrays of a VectorStore are shared through the page
+    cache already and are kept as they are.
+    """
+    shared = {}
+    blocks = []
+    for name, array in vectors.items():
+        if isinstance(array, np.memmap):
+            shared[name] = array
+            continue
+        shared[name], block = share_array(array)
+        blocks.append(block)
+    return shared, blocks
+
+
+def serve(engine, conn):
+    """Loop of a worker, answering (method, args, kwargs) requests"""
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+
+        method, args, kwargs = request
+        try:
+            response = (True, getattr(engine, method)(*args, **kwargs))
+        except Exception as e:
+            response = (False, e)
+        conn.send(response)
+
+    conn.close()
+
+
+class PreforkServer:
+
+    """Serving one initialized SearchEngine from many forked processes
+
+    - engine: SearchEngine, initialized once in the parent
+    - workers: number of forked worker processes
+
+    The vectors of the engine are placed in shared memory (or kept
+    memory-mapped) and the workers are forked after the vectorizer and
+    the tokenizer are loaded, so every worker attaches to the same pages
+    instead of loading its own copy. Loaded objects are frozen out of the
+    garbage collector before forking, so that collections in the workers
+    do not write to (and copy) their pages.
+
+    Requests are sent over a pipe to an idle worker, `search` and
+    `search_many` can be called from many threads of the parent. The
+    engine's `data_fetcher` runs in the workers, connections it opens
+    should be created lazily, after the fork.
+    """
+
+    METHODS = ("search", "search_many")
+
+    def __init__(self, engine, workers):
+        assert workers > 0
+        assert "fork" in multiprocessing.get_all_start_methods()
+        # a process pool, or pipes to shards, do not survive a fork
+        assert getattr(engine, "ranker", None) is None
+        assert getattr(engine, "index", None) != "sharded"
+
+        self.engine = engine
+        self.workers = workers
+        self.processes = []
+        self.blocks = []
+        self.idle = queue.Queue()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        assert not self.processes
+
+        # the parent keeps only the shared copy of the vectors
+        self.engine.vectors, self.blocks = share_vectors(self.engine.vectors)
+
+        gc.collect()
+        gc.freeze()
+
+        ctx = multiprocessing.get_context("fork")
+        for _ in range(self.workers):
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=serve, args=(self.engine, child_conn), daemon=True
+            )
+            process.start()
+            child_conn.close()
+
+            self.processes.append(process)
+            self.idle.put(conn)
+
+        gc.unfreeze()
+
+        return self
+
+    def call(self, method, *args, **kwargs):
+        """Calling `method` of the engine in an idle worker"""
+        assert method in self.METHODS
+        assert self.processes
+
+        conn = self.idle.get()
+        try:
+            conn.send((method, args, kwargs))
+            ok, response = conn.recv()
+        finally:
+            self.idle.put(conn)
+
+        if not ok:
+            raise response
+        return response
+
+    def search(self, keywords, cluster_size: int = 50, k: int = 100):
+        """Same as `SearchEngine.search`, answered by a worker"""
+        return self.call("search", keywords, cluster_size, k)
+
+    def search_many(self, keywords_list, cluster_size: int = 50, k: int = 100):
+        """Same as `SearchEngine.search_many`, answered by a worker"""
+        return self.call("search_many", keywords_list, cluster_size, k)
+
+    def close(self):
+        """Stopping the workers and releasing the shared memory"""
+        for _ in self.processes:
+            conn = self.idle.get()
+            conn.send(None)
+            conn.close()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+        # the parent gets private copies back before the blocks are freed
+        self.engine.vectors = {
+            name: array if isinstance(array, np.memmap) else np.array(array)
+            for name, array in self.engine.vectors.items()
+        }
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
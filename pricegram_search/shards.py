@@ -0,0 +1,148 @@
+"""Implementation of ShardedIndex"""
+from __future__ import annotations
+
+import multiprocessing
+import threading
+
+import numpy as np
+
+from .retrieval import top_k
+
+
+def serve_shard(conn, matrix, ids):
+    """Loop of a shard worker, answering (queries_list, k) requests
+
+    Every query group is scored against the rows of the shard, and the
+    local top-k ids and scores are sent back.
+    """
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+
+        queries_list, k = request
+        try:
+            results = []
+            for queries in queries_list:
+                scores = (queries @ matrix.T).mean(axis=0)
+                idx = top_k(scores, k)
+                results.append((ids[idx], scores[idx]))
+            response = (True, results)
+        except Exception as e:
+            response = (False, e)
+        conn.send(response)
+
+    conn.close()
+
+
+class ShardedIndex:
+
+    """Exact search over shards of the catalog, served by worker processes
+
+    - matrix: L2-normalized catalog, split into contiguous row ranges
+    - ids: product ids, aligned with the rows of the matrix
+    - n_shards: number of shards, one worker process each
+
+    Workers only hold their own rows and ids and are reached over a pipe,
+    standing in for remote nodes. A search is scattered to every shard
+    before any reply is read, so the shards score in parallel, and the
+    local top-k lists are merged into the global top-k. Closing waits
+    for the searches in flight, later searches raise a ValueError.
+    """
+
+    def __init__(self, matrix, ids, n_shards=4):
+        assert n_shards > 0
+        assert len(ids) == len(matrix)
+
+        ctx = multiprocessing.get_context()
+        self.conns = []
+        self.processes = []
+        self._lock = threading.Lock()
+
+        # searches in flight, waited for by `close`
+        self._searches = 0
+        self._closed = False
+        self._state = threading.Condition()
+
+        bounds = np.linspace(0, len(matrix), n_shards + 1).astype(int)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=serve_shard,
+                args=(
+                    child_conn,
+                    matrix[start:end],
+                    np.asarray(ids[start:end]),
+                ),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+
+            self.conns.append(conn)
+            self.processes.append(process)
+
+    @property
+    def n_shards(self):
+        return len(self.conns)
+
+    def search(self, queries_list, k):
+        """Global top-k ids and scores of every query group
+
+        - queries_list: (m, dim) normalized queries per group, the scores
+          of a group are averaged over its m rows
+        Returns a list of (ids, scores) arrays, sorted by score.
+        """
+        queries_list = [
+            np.asarray(i, dtype=np.float32).reshape(-1, i.shape[-1])
+            for i in queries_list
+        ]
+
+        with self._state:
+            if self._closed:
+                raise ValueError("search on a closed ShardedIndex")
+            self._searches += 1
+
+        try:
+            with self._lock:
+                # scattering to every shard before gathering
+                for conn in self.conns:
+                    conn.send((queries_list, k))
+                responses = [conn.recv() for conn in self.conns]
+        finally:
+            with self._state:
+                self._searches -= 1
+                self._state.notify_all()
+
+        for ok, response in responses:
+            if not ok:
+                raise response
+        shards = [response for ok, response in responses]
+
+        # merging the local top-k lists of every group
+        results = []
+        for i in range(len(queries_list)):
+            ids = np.concatenate([shard[i][0] for shard in shards])
+            scores = np.concatenate([shard[i][1] for shard in shards])
+            order = top_k(scores, k)
+            results.append((ids[order], scores[order]))
+
+        return results
+
+    def close(self):
+        """Stopping the shard workers, once the searches in flight are done"""
+        with self._state:
+            self._closed = True
+            self._state.wait_for(lambda: self._searches == 0)
+
+        with self._lock:
+            for conn in self.conns:
+                conn.send(None)
+                conn.close()
+            for process in self.processes:
+                process.join()
+            self.conns = []
+            self.processes = []
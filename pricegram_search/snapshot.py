@@ -0,0 +1,239 @@
+"""Implementation of Snapshot"""
+from __future__ import annotations
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from .store import replacing
+
+MAGIC = b"PGSNAPSH"
+FORMAT_VERSION = 1
+
+# sections start on cache line boundaries, so that they can be mapped
+ALIGNMENT = 64
+
+# magic, offset and length of the header
+PREAMBLE = struct.Struct("<8sQQ")
+
+# vocabulary terms are joined around a NUL, which no token contains
+SEPARATOR = "\x00"
+
+# vectorizer parameters that are not plain data and are set by post_init
+SKIPPED_PARAMS = ("tokenizer", "preprocessor", "vocabulary", "dtype")
+
+
+def align(n):
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def vectorizer_state(vectorizer):
+    """Parameters, vocabulary terms by column and idf of a fitted vectorizer"""
+    params = {
+        k: v
+        for k, v in vectorizer.get_params().items()
+        if k not in SKIPPED_PARAMS
+    }
+    assert isinstance(params["analyzer"], str)
+    if isinstance(params["stop_words"], (set, frozenset)):
+        params["stop_words"] = sorted(params["stop_words"])
+    params["dtype"] = np.dtype(vectorizer.dtype).str
+
+    terms = [""] * len(vectorizer.vocabulary_)
+    for term, i in vectorizer.vocabulary_.items():
+        terms[i] = term
+
+    idf = None
+    if getattr(vectorizer, "use_idf", False):
+        idf = np.asarray(vectorizer.idf_, dtype=np.float64)
+
+    return params, terms, idf
+
+
+def build_vectorizer(params, terms, idf):
+    """Fitted TfidfVectorizer from its parameters, vocabulary and idf"""
+    from sklearn.feature_extraction.text import TfidfTransformer
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    params = dict(params)
+    params["ngram_range"] = tuple(params["ngram_range"])
+    params["dtype"] = np.dtype(params["dtype"]).type
+
+    vectorizer = TfidfVectorizer(**params)
+    vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms)}
+
+    # the weighting is restored directly, instead of refitting it
+    tfidf = TfidfTransformer(
+        norm=vectorizer.norm,
+        use_idf=vectorizer.use_idf,
+        smooth_idf=vectorizer.smooth_idf,
+        sublinear_tf=vectorizer.sublinear_tf,
+    )
+    tfidf.n_features_in_ = len(terms)
+    if idf is not None:
+        tfidf.idf_ = np.asarray(idf)
+    vectorizer._tfidf = tfidf
+
+    return vectorizer
+
+
+class Snapshot:
+
+    """Every loaded artifact of an engine in one versioned file
+
+    - preamble: magic, offset and length of the header
+    - sections: raw arrays, each aligned to 64 bytes
+      - vocabulary: terms by column, NUL separated utf-8
+      - idf: float64 idf weights of the vectorizer
+      - tokenizer: tokenizer.json state of the fast tokenizer, if any
+      - vectors, normalized, ids: the vector store
+      - index.*: arrays of the "ivf" or "sparse" index, if any
+    - header.json: format version, offset, dtype and shape of every
+      section, the vectorizer parameters, the kind and metadata of the
+      index and the artifact versions
+
+    The header is written last, after the sections, and the file is
+    written to a temporary path first, so a reader never sees a partial
+    snapshot. Reading memory-maps the vector and index sections.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def header(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            preamble = f.read(PREAMBLE.size)
+            if len(preamble) != PREAMBLE.size:
+                return {}
+            magic, offset, length = PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                return {}
+            f.seek(offset)
+            header = json.loads(f.read(length))
+        if header.get("format") != FORMAT_VERSION:
+            return {}
+        return header
+
+    def exists(self):
+        return bool(self.header())
+
+    def write(
+        self, vectorizer, vectors, tokenizer_state=None, index=None, **meta
+    ):
+        params, terms, idf = vectorizer_state(vectorizer)
+
+        ids = np.asarray(vectors["ids"])
+        if ids.dtype.kind == "O":
+            # object arrays can not be memory-mapped
+            ids = ids.astype(str)
+
+        vocabulary = SEPARATOR.join(terms).encode("utf-8")
+        sections = {
+            "vocabulary": np.frombuffer(vocabulary, dtype=np.uint8),
+            "vectors": np.asarray(vectors["vectors"], dtype=np.float32),
+            "normalized": np.asarray(vectors["normalized"], np.float32),
+            "ids": ids,
+        }
+        if idf is not None:
+            sections["idf"] = idf
+        if tokenizer_state is not None:
+            state = tokenizer_state.encode("utf-8")
+            sections["tokenizer"] = np.frombuffer(state, dtype=np.uint8)
+        if index is not None:
+            arrays, index_meta = index.state()
+            for name, array in arrays.items():
+                sections[f"index.{name}"] = array
+            meta["index"] = {"kind": index.KIND, **index_meta}
+
+        with replacing(self.path) as f:
+            f.write(PREAMBLE.pack(MAGIC, 0, 0))
+
+            # writing the sections, aligned
+            layout = {}
+            for name, array in sections.items():
+                array = np.ascontiguousarray(array)
+                offset = align(f.tell())
+                f.seek(offset)
+                f.write(array.tobytes())
+                layout[name] = {
+                    "offset": offset,
+                    "dtype": array.dtype.str,
+                    "shape": list(array.shape),
+                }
+
+            # the header is written last and marks the snapshot as complete
+            header = {
+                "format": FORMAT_VERSION,
+                "sections": layout,
+                "vectorizer": params,
+                **meta,
+            }
+            header = json.dumps(header).encode("utf-8")
+            offset = f.tell()
+            f.write(header)
+            f.seek(0)
+            f.write(PREAMBLE.pack(MAGIC, offset, len(header)))
+
+    def section(self, header, name, mmap_mode="r"):
+        layout = header["sections"][name]
+        dtype = np.dtype(layout["dtype"])
+        shape = tuple(layout["shape"])
+
+        # empty sections can not be mapped
+        if mmap_mode is None or 0 in shape:
+            count = int(np.prod(shape))
+            with open(self.path, "rb") as f:
+                f.seek(layout["offset"])
+                array = np.fromfile(f, dtype=dtype, count=count)
+            return array.reshape(shape)
+
+        return np.memmap(self.path, dtype, mmap_mode, layout["offset"], shape)
+
+    def read(self, mmap_mode="r"):
+        """Vectorizer, tokenizer state, vectors and index of the snapshot
+
+        Only the vectorizer's vocabulary and idf are copied in memory, the
+        vectors and the index arrays are mapped. The index is None, or its
+        "kind", metadata and "arrays".
+        """
+        header = self.header()
+        assert header, f"not a snapshot: {self.path}"
+        sections = header["sections"]
+
+        terms = bytes(self.section(header, "vocabulary", None))
+        terms = terms.decode("utf-8").split(SEPARATOR)
+        if not sections["vocabulary"]["shape"][0]:
+            terms = []
+
+        idf = None
+        if "idf" in sections:
+            idf = self.section(header, "idf", None)
+
+        tokenizer_state = None
+        if "tokenizer" in sections:
+            state = bytes(self.section(header, "tokenizer", None))
+            tokenizer_state = state.decode("utf-8")
+
+        index = None
+        if "index" in header:
+            arrays = {
+                name.split(".", 1)[1]: self.section(header, name, mmap_mode)
+                for name in sections
+                if name.startswith("index.")
+            }
+            index = {"arrays": arrays, **header["index"]}
+
+        return {
+            "header": header,
+            "vectorizer": build_vectorizer(header["vectorizer"], terms, idf),
+            "tokenizer_state": tokenizer_state,
+            "index": index,
+            "vectors": {
+                name: self.section(header, name, mmap_mode)
+                for name in ("vectors", "ids", "normalized")
+            },
+        }
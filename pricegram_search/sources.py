@@ -0,0 +1,139 @@
+"""Implementation of artifact Sources"""
+from __future__ import annotations
+
+import glob
+import hashlib
+import os
+import shutil
+import urllib.parse
+import urllib.request
+
+# bytes copied per read while downloading and hashing
+CHUNK_SIZE = 1 << 20
+
+
+def sha256(path):
+    """Hex sha256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def part_path(path):
+    return path + ".part"
+
+
+def remove_parts(path):
+    """Removing the part files of `path`, left by any source"""
+    for part in glob.glob(glob.escape(path) + "*.part"):
+        os.remove(part)
+
+
+def resume_offset(path):
+    """Bytes of `path` already fetched by an interrupted download"""
+    path = part_path(path)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def content_size(headers, offset=0):
+    """Size of the whole file announced by an http response, or None"""
+    content_range = headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("*"):
+        return int(content_range.rsplit("/", 1)[1])
+
+    length = headers.get("Content-Length")
+    if length is None:
+        return None
+    return offset + int(length)
+
+
+class LocalSource:
+
+    """Artifacts copied from a local directory, or a file:// mirror
+
+    Files are looked up by the "path" of their config entry. An
+    interrupted copy is resumed from the bytes already copied.
+
+    `fetch` of every source returns the size the file should have, or
+    None when the source does not know it.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def fetch(self, info, path):
+        offset = resume_offset(path)
+        with open(os.path.join(self.root, info["path"]), "rb") as src:
+            size = os.fstat(src.fileno()).st_size
+            src.seek(offset)
+            with open(part_path(path), "ab") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(part_path(path), path)
+        return size
+
+
+class HTTPSource:
+
+    """Artifacts downloaded from an http(s) mirror, `base_url/<path>`
+
+    An interrupted download is resumed with a ranged request, servers
+    that ignore the range send the whole file again.
+    """
+
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timeout = timeout
+
+    def fetch(self, info, path):
+        url = urllib.parse.urljoin(self.base_url, info["path"])
+        offset = resume_offset(path)
+
+        request = urllib.request.Request(url)
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+
+        with urllib.request.urlopen(request, timeout=self.timeout) as src:
+            # 206 continues the part file, anything else replaces it
+            resumed = offset and src.status == 206
+            size = content_size(src.headers, offset if resumed else 0)
+            with open(part_path(path), "ab" if resumed else "wb") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(part_path(path), path)
+        return size
+
+
+class DriveSource:
+
+    """Artifacts downloaded from Google Drive by the "id" of their entry
+
+    The size is not returned, gdown compares the downloaded bytes to the
+    Content-Length of the response itself.
+    """
+
+    def fetch(self, info, path):
+        # heavy dependencies are imported only when they are used
+        import gdown
+
+        gdown.download(id=info["id"], output=path, quiet=False, resume=True)
+
+
+def get_source(source=None):
+    """Source of the artifacts
+
+    - None: Google Drive
+    - "file://..." or a directory: local mirror
+    - "http://..." or "https://...": http mirror
+    - any object with a `fetch(info, path)` method
+    """
+    if source is None:
+        return DriveSource()
+    if not isinstance(source, str):
+        return source
+
+    if source.startswith("file://"):
+        return LocalSource(urllib.request.url2pathname(source[7:]))
+    if source.startswith(("http://", "https://")):
+        return HTTPSource(source)
+    return LocalSource(source)
@@ -0,0 +1,140 @@
+"""Implementation of VectorStore"""
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from .retrieval import normalize
+
+FORMAT_VERSION = 1
+
+
+@contextlib.contextmanager
+def replacing(path, mode="wb"):
+    """File replacing `path` once it is completely written
+
+    The file is written to a temporary file of its own in the same folder
+    first, so that processes which are mapping the old file are never
+    handed a half written one, and processes writing the same file at
+    once never write into each other's.
+    """
+    folder, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(
+        suffix=".tmp", prefix=name + ".", dir=folder or "."
+    )
+    try:
+        # readable by other users, like the files `open` creates
+        os.chmod(tmp_path, 0o644)
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_array(path, array):
+    with replacing(path) as f:
+        np.save(f, array)
+
+
+class VectorStore:
+
+    """Binary, memory-mapped storage for the product vectors
+
+    A store is a folder holding
+    - matrix.npy: float32 matrix of shape (n_products, dim)
+    - ids.npy: product ids, aligned with the rows of the matrix
+    - header.json: format version, shape, dtypes and artifact version
+    - normalized.npy: L2-normalized copy of the matrix, built on first read
+
+    The arrays are memory-mapped read-only, so every process on a host
+    that opens the same store shares the same pages of the page cache.
+    """
+
+    MATRIX = "matrix.npy"
+    IDS = "ids.npy"
+    NORMALIZED = "normalized.npy"
+    HEADER = "header.json"
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_path(self, name):
+        return os.path.join(self.path, name)
+
+    def header(self):
+        path = self.get_path(self.HEADER)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "rb") as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT_VERSION:
+            return {}
+        return header
+
+    def exists(self):
+        return bool(self.header())
+
+    def save_array(self, name, array):
+        save_array(self.get_path(name), array)
+
+    def write(self, vectors, ids, **meta):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids)
+        if ids.dtype.kind == "O":
+            # object arrays can not be memory-mapped
+            ids = ids.astype(str)
+
+        assert matrix.ndim == 2
+        assert len(ids) == len(matrix)
+
+        # the header is written last and marks the store as complete
+        header_path = self.get_path(self.HEADER)
+        for name in (self.HEADER, self.NORMALIZED):
+            if os.path.exists(self.get_path(name)):
+                os.remove(self.get_path(name))
+
+        self.save_array(self.MATRIX, matrix)
+        self.save_array(self.IDS, ids)
+
+        header = {
+            "format": FORMAT_VERSION,
+            "n": int(matrix.shape[0]),
+            "dim": int(matrix.shape[1]),
+            "dtype": matrix.dtype.str,
+            "ids_dtype": ids.dtype.str,
+            **meta,
+        }
+        with replacing(header_path, "w") as f:
+            json.dump(header, f)
+
+    def read(self, mmap_mode="r"):
+        # building the normalized matrix once, later reads only map it
+        if not os.path.exists(self.get_path(self.NORMALIZED)):
+            matrix = np.load(self.get_path(self.MATRIX), mmap_mode="r")
+            self.save_array(self.NORMALIZED, normalize(matrix))
+
+        return {
+            "vectors": np.load(
+                self.get_path(self.MATRIX), mmap_mode=mmap_mode
+            ),
+            "ids": np.load(self.get_path(self.IDS), mmap_mode=mmap_mode),
+            "normalized": np.load(
+                self.get_path(self.NORMALIZED), mmap_mode=mmap_mode
+            ),
+        }
+
+    def convert_json(self, json_path, **meta):
+        """Converting a `vectors.json` of {"vectors", "ids"} to the store"""
+        with open(json_path, "rb") as f:
+            data = json.load(f)
+        self.write(data["vectors"], data["ids"], **meta)
@@ -0,0 +1,349 @@
+"""Offline benchmark of the search engine
+
+Builds a synthetic catalog and vectorizer, so no artifacts or network are
+needed, and reports
+- per stage latency percentiles (vectorizer, cluster, sorter)
+- search throughput across thread and process counts
+- peak RSS of the benchmark and its worker processes
+- scaling curves over catalog size, keyword count and `k`
+
+Results are saved as JSON, and compared against a baseline file to catch
+regressions between releases.
+
+    python pricegram_search/tests/benchmark.py -o results.json
+    python pricegram_search/tests/benchmark.py --baseline results.json
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import pricegram_search
+from pricegram_search import SearchEngine
+from pricegram_search.server import PreforkServer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BRANDS = ["hp", "dell", "lenovo", "asus", "acer", "apple", "msi", "samsung"]
+CPUS = ["core i3", "core i5", "core i7", "core i9", "ryzen 5", "ryzen 7"]
+RAMS = ["4gb ram", "8gb ram", "16gb ram", "32gb ram", "64gb ram"]
+STORAGES = ["256gb ssd", "512gb ssd", "1tb ssd", "1tb hdd", "2tb hdd"]
+GPUS = ["rtx 3050", "rtx 4060", "rtx 4090", "intel iris", "radeon 680m"]
+COLORS = ["black", "silver", "grey", "blue", "white"]
+KINDS = ["laptop", "notebook", "ultrabook", "gaming laptop", "desktop"]
+
+ATTRIBUTES = [BRANDS, CPUS, RAMS, STORAGES, GPUS, COLORS, KINDS]
+
+STAGES = ["Vectorizer", "Cluster", "Sorter"]
+
+PERCENTILES = [50, 90, 99]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n",
+        "--products",
+        type=int,
+        default=20000,
+        help="Catalog size of the main measurements (default: 20000)",
+    )
+    parser.add_argument(
+        "-q",
+        "--queries",
+        type=int,
+        default=200,
+        help="Searches per measurement (default: 200)",
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Thread counts of the throughput test (default: 1 2 4 8)",
+    )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="Process counts of the throughput test (default: 1 2 4)",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 50000],
+        help="Catalog sizes of the scaling curve",
+    )
+    parser.add_argument(
+        "--keywords",
+        type=int,
+        nargs="+",
+        default=[1, 2, 3, 4, 5],
+        help="Keyword counts of the scaling curve",
+    )
+    parser.add_argument(
+        "--ks",
+        type=int,
+        nargs="+",
+        default=[50, 100, 200, 500],
+        help="Values of `k` of the scaling curve",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the synthetic catalog and queries (default: 0)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Path of the JSON results",
+    )
+    parser.add_argument(
+        "--baseline",
+        help="JSON results of an earlier run to compare against",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.2,
+        help="Slowdown over the baseline reported as a regression",
+    )
+    return parser.parse_args()
+
+
+def synthetic_catalog(n, seed=0):
+    """`n` laptop like products, with a name and specs"""
+    rng = np.random.RandomState(seed)
+    picks = [rng.randint(len(i), size=n) for i in ATTRIBUTES]
+    models = rng.randint(100, 10000, size=n)
+
+    products = []
+    for i in range(n):
+        brand, cpu, ram, storage, gpu, color, kind = [
+            values[p[i]] for values, p in zip(ATTRIBUTES, picks)
+        ]
+        products.append(
+            {
+                "id": i,
+                "name": f"{brand} {kind} {models[i]} {cpu}",
+                "specs": {"ram": ram, "storage": storage, "gpu": gpu},
+                "colors": [color],
+            }
+        )
+    return products
+
+
+def product_text(product):
+    return " ".join(
+        [product["name"], *product["specs"].values(), *product["colors"]]
+    )
+
+
+def synthetic_engine(n, seed=0, **kwargs):
+    """SearchEngine over a synthetic catalog, with a fitted vectorizer"""
+    products = synthetic_catalog(n, seed)
+    texts = [product_text(i) for i in products]
+
+    def data_fetcher(ids):
+        return [products[i] for i in ids]
+
+    engine = SearchEngine(
+        data_fetcher=data_fetcher, dump_path=None, skip_init=True, **kwargs
+    )
+    engine.vectorizer = TfidfVectorizer(dtype=np.float32).fit(texts)
+    engine.bert_tokenizer = engine.vectorizer.build_tokenizer()
+    engine.vectors = {
+        "vectors": engine.vectorizer.transform(texts).toarray(),
+        "ids": np.arange(n),
+    }
+    engine.post_init()
+    return engine
+
+
+def synthetic_queries(n, n_keywords=3, seed=0):
+    """`n` keyword lists of `n_keywords` distinct attributes each"""
+    rng = np.random.RandomState(seed + 1)
+    queries = []
+    for _ in range(n):
+        attributes = rng.choice(len(ATTRIBUTES), n_keywords, replace=False)
+        queries.append(
+            [
+                ATTRIBUTES[a][rng.randint(len(ATTRIBUTES[a]))]
+                for a in attributes
+            ]
+        )
+    return queries
+
+
+def percentiles(latencies):
+    """Latency percentiles in milliseconds"""
+    latencies = np.asarray(latencies) * 1000
+    return {
+        f"p{p}": round(float(np.percentile(latencies, p)), 3)
+        for p in PERCENTILES
+    }
+
+
+def stage_latencies(engine, queries, cluster_size=50, k=100):
+    """Latency percentiles of every stage of `pipe`, and of the total"""
+    pipes = {
+        "Vectorizer": engine.vectorizer_pipe,
+        "Cluster": engine.cluster_pipe,
+        "Sorter": engine.sorter_pipe,
+    }
+
+    latencies = {name: [] for name in [*STAGES, "Total"]}
+    for keywords in queries:
+        data = {"keywords": keywords, "cluster_size": cluster_size, "k": k}
+        total = 0
+        for name, pipe in pipes.items():
+            start = time.perf_counter()
+            data = pipe(**data)
+            elapsed = time.perf_counter() - start
+            latencies[name].append(elapsed)
+            total += elapsed
+        latencies["Total"].append(total)
+
+    return {name: percentiles(i) for name, i in latencies.items()}
+
+
+def throughput(search, queries, concurrency):
+    """Searches per second with `concurrency` concurrent callers"""
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        start = time.perf_counter()
+        list(executor.map(search, queries))
+        elapsed = time.perf_counter() - start
+    return round(len(queries) / elapsed, 2)
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of its largest finished child"""
+    if resource is None:
+        return {}
+
+    # bytes on macOS, kilobytes elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    rss = {}
+    for name, who in [
+        ("self", resource.RUSAGE_SELF),
+        ("children", resource.RUSAGE_CHILDREN),
+    ]:
+        rss[name] = round(
+            resource.getrusage(who).ru_maxrss * scale / 2**20, 1
+        )
+    return rss
+
+
+def run(args):
+    results = {
+        "meta": {
+            "version": pricegram_search.__version__,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": {
+                k: v
+                for k, v in vars(args).items()
+                if k not in ("output", "baseline")
+            },
+        },
+    }
+
+    print(">>> Setting Up")
+    engine = synthetic_engine(args.products, args.seed)
+    queries = synthetic_queries(args.queries, seed=args.seed)
+
+    print(">>> Stage Latencies")
+    results["stages"] = stage_latencies(engine, queries)
+
+    def search(keywords):
+        return engine.search(keywords)
+
+    print(">>> Throughput")
+    results["throughput"] = {"threads": {}, "processes": {}}
+    for n in args.threads:
+        qps = throughput(search, queries, n)
+        results["throughput"]["threads"][str(n)] = qps
+    for n in args.processes:
+        with PreforkServer(engine, n) as server:
+            qps = throughput(server.search, queries, n)
+        results["throughput"]["processes"][str(n)] = qps
+
+    print(">>> Scaling")
+    scaling = {"products": [], "keywords": [], "k": []}
+    for n in args.sizes:
+        curve_engine = synthetic_engine(n, args.seed)
+        scaling["products"].append(
+            {"n": n, **stage_latencies(curve_engine, queries)}
+        )
+        del curve_engine
+    for n in args.keywords:
+        curve_queries = synthetic_queries(args.queries, n, args.seed)
+        scaling["keywords"].append(
+            {"n": n, **stage_latencies(engine, curve_queries)}
+        )
+    for k in args.ks:
+        scaling["k"].append({"n": k, **stage_latencies(engine, queries, k=k)})
+    results["scaling"] = scaling
+
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Stages whose p50 latency regressed past `tolerance` x baseline"""
+    regressions = []
+    for stage, current in results["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before or not before["p50"]:
+            continue
+        ratio = current["p50"] / before["p50"]
+        print(f"{stage:>10}: p50 {current['p50']} ms, x{ratio:.2f}")
+        if ratio > tolerance:
+            regressions.append(stage)
+    return regressions
+
+
+def print_results(results):
+    print(">>> Results")
+    for stage, latency in results["stages"].items():
+        print(f"{stage:>10}: {latency}")
+    for kind, qps in results["throughput"].items():
+        print(f"{kind:>10}: {qps} searches/s")
+    print(f"{'RSS MB':>10}: {results['peak_rss_mb']}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(args)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "rb") as f:
+            baseline = json.load(f)
+        print(">>> Baseline")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from pricegram_search import SearchEngine
+from pricegram_search.encoder import CombinationEncoder
+from pricegram_search.retrieval import normalize
+
+
+@pytest.fixture
+def make_engine():
+    """SearchEngine over a list of products, without loading artifacts
+
+    The products are served by an in-memory data fetcher and vectorized
+    from `text(product)` (their name by default) by `vectorizer` (a plain
+    TfidfVectorizer by default), fitted on those texts.
+    """
+
+    def make_engine(products, text=lambda i: i["name"], vectorizer=None):
+        by_id = {i["id"]: i for i in products}
+
+        def data_fetcher(ids):
+            return [by_id[i] for i in ids]
+
+        engine = SearchEngine(
+            data_fetcher=data_fetcher, dump_path=None, skip_init=True
+        )
+
+        texts = [text(i) for i in products]
+        if vectorizer is None:
+            vectorizer = TfidfVectorizer()
+        engine.vectorizer = vectorizer.fit(texts)
+        engine.encoder = CombinationEncoder(engine.vectorizer)
+        vectors = engine.vectorizer.transform(texts).toarray()
+        # breaking the ties between products of symmetric catalogs
+        vectors += np.random.RandomState(0).rand(*vectors.shape) * 1e-3
+        engine.vectors = {
+            "vectors": vectors,
+            "ids": np.array([i["id"] for i in products]),
+            "normalized": normalize(vectors),
+        }
+        return engine
+
+    return make_engine
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from pricegram_search import SearchEngine
+from pricegram_search.ann import IVFIndex
+from pricegram_search.ann import recall_at_k
+from pricegram_search.retrieval import normalize
+from pricegram_search.retrieval import top_k
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    # clustered data, like products of a few categories
+    rng = np.random.RandomState(0)
+    centers = rng.rand(10, 32)
+    points = centers[rng.randint(10, size=2000)] + rng.rand(2000, 32) * 0.3
+    return normalize(points)
+
+
+@pytest.fixture(scope="module")
+def index(matrix):
+    return IVFIndex.build(matrix, n_lists=16)
+
+
+def test_build(index, matrix):
+    assert index.n_lists == 16
+    assert index.offsets[-1] == len(matrix)
+    assert sorted(index.rows.tolist()) == list(range(len(matrix)))
+    assert np.allclose(index.vectors, matrix[index.rows])
+
+
+def test_search_all_lists_is_exact(index, matrix):
+    query = matrix[7]
+    exact = top_k(matrix @ query, 20)
+    assert index.search(query, 20, nprobe=16).tolist() == exact.tolist()
+
+
+def test_recall_at_k(index, matrix):
+    queries = np.random.RandomState(1).rand(20, 32) + matrix[:20]
+    assert recall_at_k(index, matrix, queries, k=10, nprobe=16) == 1.0
+    assert recall_at_k(index, matrix, queries, k=10, nprobe=4) >= 0.8
+
+
+def test_save_load(index, tmp_path):
+    index.save(str(tmp_path), v=1)
+    loaded = IVFIndex.load(str(tmp_path))
+
+    assert IVFIndex.header(str(tmp_path))["v"] == 1
+    assert list(tmp_path.glob("*.tmp")) == []
+    assert np.array_equal(loaded.rows, index.rows)
+    assert loaded.search(index.vectors[0], 5).tolist() == (
+        index.search(index.vectors[0], 5).tolist()
+    )
+
+
+def test_init_index_more_lists_than_rows(matrix, tmp_path, monkeypatch):
+    engine = SearchEngine(
+        data_fetcher=None, dump_path=str(tmp_path), skip_init=True
+    )
+    engine.index = "ivf"
+    engine.n_lists = 16
+    engine.vectors = {"normalized": matrix[:5]}
+
+    built = []
+    build = IVFIndex.build
+
+    def counting_build(*args, **kwargs):
+        built.append(args)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(IVFIndex, "build", counting_build)
+
+    engine.init_index(verbose=0)
+    assert engine.ann.n_lists == 5
+
+    # the index built with fewer lists is not stale on the next start
+    engine.init_index(verbose=0)
+    assert len(built) == 1
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import threading
+
+from pricegram_search.cache import LRUCache
+from pricegram_search.cache import TokenizerCache
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    # "b" is the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {
+        "hits": 3,
+        "misses": 1,
+        "size": 2,
+        "maxsize": 2,
+        "bytes": 0,
+    }
+
+
+def test_lru_cache_threads():
+    cache = LRUCache(maxsize=50)
+
+    def worker(i):
+        for j in range(200):
+            cache.set((i, j % 60), j)
+            cache.get((i, j % 30))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cache) == 50
+    assert cache.hits + cache.misses == 8 * 200
+
+
+def test_tokenizer_cache():
+    calls = []
+
+    def tokenizer(text):
+        calls.append(text)
+        return text.split()
+
+    tokenize = TokenizerCache(tokenizer, maxsize=10)
+    assert tokenize("8gb ram") == ["8gb", "ram"]
+    assert tokenize("8gb ram") == ["8gb", "ram"]
+    assert tokenize("core i7") == ["core", "i7"]
+
+    assert calls == ["8gb ram", "core i7"]
+    assert tokenize.stats()["hits"] == 1
+    assert tokenize.stats()["misses"] == 2
+
+
+def test_tokenizer_cache_batch():
+    batches = []
+
+    class Tokenizer:
+        def __call__(self, text):
+            return text.split()
+
+        def batch(self, texts):
+            batches.append(texts)
+            return [text.split() for text in texts]
+
+    tokenize = TokenizerCache(Tokenizer(), maxsize=10)
+    tokenize("8gb ram")
+
+    tokens = tokenize.batch(["8gb ram", "core i7", "core i7", "1tb ssd"])
+
+    assert tokens == [
+        ["8gb", "ram"],
+        ["core", "i7"],
+        ["core", "i7"],
+        ["1tb", "ssd"],
+    ]
+    assert batches == [["core i7", "1tb ssd"]]
+
+
+def test_lru_cache_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("time.monotonic", lambda: now[0])
+
+    cache = LRUCache(maxsize=10, ttl=5)
+    cache.set("a", 1)
+    now[0] += 4
+    assert cache.get("a") == 1
+    assert "a" in cache
+
+    now[0] += 2
+    assert cache.get("a") is None
+    assert "a" not in cache
+    assert len(cache) == 0
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import pricegram_search.loader
+from pricegram_search import SearchEngine
+from pricegram_search.loader import Downloader
+
+TEXTS = ["hp laptop core i5", "dell laptop core i7", "lenovo ssd 16gb ram"]
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    root = tmp_path / "mirror"
+    root.mkdir()
+
+    vectorizer = TfidfVectorizer().fit(TEXTS)
+    joblib.dump(vectorizer, root / "vectorizer.pkl")
+    vectors = vectorizer.transform(TEXTS).toarray().tolist()
+    with open(root / "vectors.json", "w") as f:
+        json.dump({"vectors": vectors, "ids": [1, 2, 3]}, f)
+
+    return root
+
+
+def config(mirror):
+    def digest(name):
+        return hashlib.sha256((mirror / name).read_bytes()).hexdigest()
+
+    return [
+        {
+            "name": "vectorizer",
+            "v": 1,
+            "info": {
+                "id": "x",
+                "path": "vectorizer.pkl",
+                "sha256": digest("vectorizer.pkl"),
+            },
+        },
+        {
+            "name": "vectors",
+            "v": 1,
+            "info": {
+                "id": "y",
+                "path": "vectors.json",
+                "sha256": digest("vectors.json"),
+                "store": "vectors",
+            },
+        },
+    ]
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    # counting the files hashed by the downloader
+    hashed = []
+    sha256 = pricegram_search.loader.sha256
+
+    def counting_sha256(path):
+        hashed.append(os.path.basename(path))
+        return sha256(path)
+
+    monkeypatch.setattr(pricegram_search.loader, "sha256", counting_sha256)
+    return hashed
+
+
+def init(mirror, dump_path):
+    engine = SearchEngine(
+        data_fetcher=None,
+        dump_path=str(dump_path),
+        skip_init=True,
+        source=f"file://{mirror}",
+    )
+    engine.config = config(mirror)
+    engine.bert_tokenizer = str.split
+    engine.init(skip_init=False, verbose=0)
+    return engine
+
+
+def test_init_from_mirror(mirror, tmp_path, hashed):
+    dump_path = tmp_path / "utils"
+
+    engine = init(mirror, dump_path)
+
+    assert engine.vectors["ids"].tolist() == [1, 2, 3]
+    assert sorted(hashed) == ["vectorizer.pkl", "vectors.json"]
+
+    # unchanged files are not hashed again
+    hashed.clear()
+    init(mirror, dump_path)
+    assert hashed == []
+
+    # a truncated file is detected and downloaded again
+    with open(dump_path / "vectorizer.pkl", "r+b") as f:
+        f.truncate(10)
+    init(mirror, dump_path)
+    assert hashed == ["vectorizer.pkl", "vectorizer.pkl"]
+    assert (dump_path / "vectorizer.pkl").read_bytes() == (
+        mirror / "vectorizer.pkl"
+    ).read_bytes()
+
+    # the source of a converted store is not needed
+    hashed.clear()
+    os.remove(dump_path / "vectors.json")
+    engine = init(mirror, dump_path)
+    assert hashed == []
+    assert not (dump_path / "vectors.json").exists()
+    assert engine.vectors["ids"].tolist() == [1, 2, 3]
+
+
+def test_downloaded_source_is_converted(mirror, tmp_path):
+    dump_path = tmp_path / "utils"
+    init(mirror, dump_path)
+
+    # the store is current, but the versions are lost and the source
+    # changed since
+    os.remove(dump_path / "versions.json")
+    with open(mirror / "vectors.json", "w") as f:
+        json.dump({"vectors": [[1.0, 0.0]], "ids": [7]}, f)
+    engine = init(mirror, dump_path)
+
+    assert engine.vectors["ids"].tolist() == [7]
+
+
+def test_checksum_mismatch(mirror, tmp_path):
+    dump_path = tmp_path / "utils"
+    dump_path.mkdir()
+    info = dict(config(mirror)[0]["info"], sha256="0" * 64)
+
+    downloader = Downloader(str(dump_path), str(mirror))
+
+    with pytest.raises(ValueError):
+        downloader.vectorizer(info)
+    assert not (dump_path / "vectorizer.pkl").exists()
+
+
+def test_truncated_download(mirror, tmp_path):
+    dump_path = tmp_path / "utils"
+    dump_path.mkdir()
+    info = dict(config(mirror)[1]["info"], sha256=None)
+    content = (mirror / "vectors.json").read_bytes()
+
+    class TruncatingSource:
+        # the first download is cut short
+        calls = 0
+
+        def fetch(self, info, path):
+            self.calls += 1
+            end = len(content) // (2 if self.calls == 1 else 1)
+            with open(path, "wb") as f:
+                f.write(content[:end])
+            return len(content)
+
+    source = TruncatingSource()
+    Downloader(str(dump_path), source).vectors(info)
+
+    assert source.calls == 2
+    assert (dump_path / "vectors.json").read_bytes() == content
+
+
+def test_truncated_after_download(mirror, tmp_path):
+    dump_path = tmp_path / "utils"
+    dump_path.mkdir()
+    # no published hash, the hash of the download is recorded
+    info = dict(config(mirror)[1]["info"], sha256=None)
+
+    downloader = Downloader(str(dump_path), str(mirror))
+    downloader.vectors(info)
+    assert downloader.verify(info)
+
+    with open(dump_path / "vectors.json", "r+b") as f:
+        f.truncate(10)
+    assert not downloader.verify(info)
+    assert not Downloader(str(dump_path), str(mirror)).verify(info)
+
+    # downloading again records the new file
+    downloader.vectors(info)
+    assert downloader.verify(info)
+
+
+def test_new_version_discards_parts(mirror, tmp_path):
+    dump_path = tmp_path / "utils"
+    init(mirror, dump_path)
+
+    # parts of an interrupted download of the previous version
+    (dump_path / "vectors.json.part").write_bytes(b"old")
+    (dump_path / "vectors.jsonabc.part").write_bytes(b"old")
+    engine = SearchEngine(
+        data_fetcher=None,
+        dump_path=str(dump_path),
+        skip_init=True,
+        source=f"file://{mirror}",
+    )
+    engine.config = config(mirror)
+    engine.config[1]["v"] = 2
+    engine.bert_tokenizer = str.split
+    engine.init(skip_init=False, verbose=0)
+
+    assert list(dump_path.glob("*.part")) == []
+    assert (dump_path / "vectors.json").read_bytes() == (
+        mirror / "vectors.json"
+    ).read_bytes()
+
+
+def test_download_concurrently(mirror, tmp_path):
+    dump_path = tmp_path / "utils"
+    dump_path.mkdir()
+
+    downloader = Downloader(str(dump_path), str(mirror), workers=2)
+    downloader.download(config(mirror))
+
+    for name in ["vectorizer.pkl", "vectors.json"]:
+        assert (dump_path / name).read_bytes() == (mirror / name).read_bytes()
+    manifest = json.loads((dump_path / "files.json").read_text())
+    assert sorted(manifest) == ["vectorizer.pkl", "vectors.json"]
+    np.testing.assert_array_equal(
+        [i["size"] for i in manifest.values()],
+        [os.path.getsize(dump_path / i) for i in manifest],
+    )
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import re
+
+import pytest
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from pricegram_search.encoder import CombinationEncoder
+from pricegram_search.utils import BasicUtils
+
+CORPUS = [
+    "core i5 16gb ram 512gb ssd laptop",
+    "core i7 8gb ram 1tb ssd gaming laptop",
+    "smartphone 64gb storage 8gb ram",
+    "tablet 128gb storage wifi",
+    "camera 20mp lens kit",
+]
+
+KEYWORDS = ["Core i5", "16GB RAM!", "512GB SSD", "ram ram", "unknown"]
+
+
+def preprocessor(x):
+    return re.sub(r"[^0-9a-zA-Z ]", "", x).lower()
+
+
+@pytest.mark.parametrize(
+    "vectorizer",
+    [
+        TfidfVectorizer(
+            tokenizer=str.split, preprocessor=preprocessor, token_pattern=None
+        ),
+        TfidfVectorizer(sublinear_tf=True, norm="l1"),
+        TfidfVectorizer(binary=True, stop_words=["ram"]),
+        CountVectorizer(),
+        CountVectorizer(binary=True),
+        TfidfVectorizer(ngram_range=(1, 2)),
+    ],
+)
+def test_transform(vectorizer):
+    vectorizer.fit(CORPUS)
+    encoder = CombinationEncoder(vectorizer)
+    queries = BasicUtils().get_all_combinations(KEYWORDS)
+
+    encoded = encoder.transform(KEYWORDS, queries)
+    expected = vectorizer.transform(queries)
+
+    assert encoded.shape == expected.shape
+    assert (encoded.toarray() == expected.toarray()).all()
+
+
+def test_additive():
+    def encoder(**kwargs):
+        return CombinationEncoder(TfidfVectorizer(**kwargs).fit(CORPUS))
+
+    assert encoder().additive()
+    assert not encoder(analyzer="char").additive()
+    assert not encoder(ngram_range=(1, 2)).additive()
+    assert not CombinationEncoder(TfidfVectorizer()).additive()
+
+
+def test_transform_many():
+    vectorizer = TfidfVectorizer().fit(CORPUS)
+    encoder = CombinationEncoder(vectorizer)
+    keywords_list = [KEYWORDS[:2], KEYWORDS, ["ssd", "core i5"]]
+    queries_list = [
+        BasicUtils().get_all_combinations(i) for i in keywords_list
+    ]
+
+    encoded, offsets = encoder.transform_many(keywords_list, queries_list)
+
+    assert offsets.tolist() == [0, 3, 34, 37]
+    for queries, start, end in zip(queries_list, offsets, offsets[1:]):
+        expected = vectorizer.transform(queries).toarray()
+        assert (encoded[start:end].toarray() == expected).all()
+
+
+class BatchTokenizer:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, text):
+        raise AssertionError("tokenizing one text at a time")
+
+    def batch(self, texts):
+        self.batches.append(texts)
+        return [text.split() for text in texts]
+
+
+@pytest.mark.parametrize("ngram_range", [(1, 1), (1, 2)])
+def test_batch_tokenizer(ngram_range):
+    vectorizer = TfidfVectorizer(
+        tokenizer=str.split, token_pattern=None, ngram_range=ngram_range
+    ).fit(CORPUS)
+    queries = BasicUtils().get_all_combinations(KEYWORDS)
+    expected = vectorizer.transform(queries).toarray()
+
+    vectorizer.tokenizer = BatchTokenizer()
+    encoded = CombinationEncoder(vectorizer).transform(KEYWORDS, queries)
+
+    assert (encoded.toarray() == expected).all()
+    assert len(vectorizer.tokenizer.batches) == 1
+
+
+def test_encode():
+    vectorizer = TfidfVectorizer(sublinear_tf=True).fit(CORPUS)
+    encoded = CombinationEncoder(vectorizer).encode(CORPUS, batch_size=2)
+
+    assert (encoded.toarray() == vectorizer.transform(CORPUS).toarray()).all()
+    assert CombinationEncoder(vectorizer).encode([]).shape[0] == 0
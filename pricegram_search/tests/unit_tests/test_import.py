@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+
+# dependencies only needed to download, load, encode or score with
+# `fuzz_ratio`
+HEAVY_MODULES = [
+    "transformers",
+    "torch",
+    "sklearn",
+    "gdown",
+    "joblib",
+    "thefuzz",
+    "scipy",
+]
+
+# generous bound on the import of the package, numpy included
+IMPORT_BUDGET = 2.0
+
+
+def import_package():
+    """Modules loaded and seconds spent by `import pricegram_search`"""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import pricegram_search\n"
+        "print(time.perf_counter() - start)\n"
+        "print(' '.join(sys.modules))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+    return set(output[1].split()), float(output[0])
+
+
+def test_heavy_modules_are_lazy():
+    modules, seconds = import_package()
+
+    assert [i for i in HEAVY_MODULES if i in modules] == []
+
+
+def test_import_time():
+    modules, seconds = import_package()
+
+    assert seconds < IMPORT_BUDGET
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from pricegram_search.inverted import InvertedIndex
+from pricegram_search.inverted import sparse_centroid
+from pricegram_search.retrieval import centroid
+from pricegram_search.retrieval import normalize
+from pricegram_search.retrieval import top_k
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    # sparse tf-idf like catalog of 500 products over 300 terms
+    rng = np.random.RandomState(0)
+    dense = rng.rand(500, 300) * (rng.rand(500, 300) < 0.05)
+    return normalize(dense)
+
+
+@pytest.fixture(scope="module")
+def encoded():
+    rng = np.random.RandomState(1)
+    return sp.csr_matrix(rng.rand(3, 300) * (rng.rand(3, 300) < 0.02))
+
+
+def test_sparse_centroid(encoded):
+    expected = centroid(encoded.toarray())
+    assert np.allclose(sparse_centroid(encoded).toarray(), expected)
+
+
+def test_search(matrix, encoded):
+    index = InvertedIndex.build(matrix, chunk_size=64)
+    scores = (centroid(encoded.toarray()) @ matrix.T)[0]
+
+    rows = index.search(encoded, 10)
+
+    assert rows.tolist() == top_k(scores, 10).tolist()
+
+
+def test_search_only_matching(matrix):
+    index = InvertedIndex.build(matrix)
+    query = sp.csr_matrix(([1.0], ([0], [5])), shape=(1, 300))
+
+    rows = index.search(query, 500)
+
+    assert sorted(rows.tolist()) == np.flatnonzero(matrix[:, 5]).tolist()
+
+
+def test_save_load(matrix, encoded, tmp_path):
+    index = InvertedIndex.build(matrix)
+    index.save(str(tmp_path), v=1)
+    loaded = InvertedIndex.load(str(tmp_path))
+
+    assert InvertedIndex.header(str(tmp_path))["v"] == 1
+    assert list(tmp_path.glob("*.tmp")) == []
+    assert loaded.shape == matrix.shape
+    assert loaded.search(encoded, 10).tolist() == (
+        index.search(encoded, 10).tolist()
+    )
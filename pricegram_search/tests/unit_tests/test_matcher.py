@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from pricegram_search import matcher
+from pricegram_search.cache import LRUCache
+from pricegram_search.matcher import find_matching_parts
+from pricegram_search.matcher import scan_matching_parts
+from pricegram_search.matcher import SuffixAutomaton
+
+
+def naive_find_matching_parts(input_string, substring):
+    # the original quadratic implementation, kept as the reference
+    matched_parts = []
+    start = 0
+    while start < len(substring):
+        found = False
+        for end in range(len(substring), start, -1):
+            if substring[start:end] in input_string:
+                matched_parts.append(substring[start:end])
+                start = end
+                found = True
+                break
+        if not found:
+            start += 1
+        if start >= len(substring):
+            break
+    return matched_parts
+
+
+@pytest.mark.parametrize(
+    "text, pattern",
+    [
+        ("abcdef", "def"),
+        ("abcdef", "xyz"),
+        ("", "abc"),
+        ("abc", ""),
+        ("namehplaptopcorei516gbram", "corei716gbram"),
+        ("aaaaab", "aaab"),
+        ("abababab", "babbab"),
+    ],
+)
+def test_find_matching_parts(text, pattern):
+    expected = naive_find_matching_parts(text, pattern)
+    assert find_matching_parts(text, pattern) == expected
+
+
+def test_find_matching_parts_random():
+    rng = random.Random(0)
+    for _ in range(2000):
+        alphabet = "abc01"[: rng.randint(1, 5)]
+        text = "".join(rng.choices(alphabet, k=rng.randint(0, 30)))
+        pattern = "".join(rng.choices(alphabet, k=rng.randint(0, 12)))
+
+        expected = naive_find_matching_parts(text, pattern)
+        assert SuffixAutomaton(text).find_matching_parts(pattern) == expected
+
+
+def test_find_matching_parts_cached(monkeypatch):
+    monkeypatch.setattr(matcher, "automata", LRUCache(max_bytes=40 * 450))
+    monkeypatch.setattr(matcher, "matches", LRUCache())
+    text = "namehplaptopcorei516gbram"
+    expected = naive_find_matching_parts(text, "corei716gbram")
+
+    # scanned until the text is matched often enough for an automaton
+    assert find_matching_parts(text, "corei716gbram") == expected
+    assert len(matcher.automata) == 0
+    assert find_matching_parts(text, "corei716gbram") == expected
+    assert len(matcher.automata) == 1
+    assert find_matching_parts(text, "corei716gbram") == expected
+    assert matcher.automata.stats()["hits"] == 1
+
+    # the cache holds automata of 40 characters of text at most
+    for text in ["a" * 10, "b" * 10, "c" * 30]:
+        for _ in range(2):
+            find_matching_parts(text, "ab")
+    assert list(matcher.automata._data) == ["b" * 10, "c" * 30]
+    assert matcher.automata.bytes == 40 * 450
+
+
+def test_scan_matching_parts():
+    rng = random.Random(1)
+    for _ in range(500):
+        text = "".join(rng.choices("abc", k=rng.randint(0, 20)))
+        pattern = "".join(rng.choices("abc", k=rng.randint(0, 10)))
+
+        expected = naive_find_matching_parts(text, pattern)
+        assert scan_matching_parts(text, pattern) == expected
@@ -0,0 +1,433 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import sys
+import threading
+
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+
+from pricegram_search import SearchEngine
+from pricegram_search.ann import IVFIndex
+from pricegram_search.cache import LRUCache
+from pricegram_search.products import ProductCache
+from pricegram_search.ranker import ProcessRanker
+from pricegram_search.retrieval import normalize
+from pricegram_search.store import VectorStore
+
+PRODUCTS = [
+    {
+        "id": i,
+        "name": f"{brand} laptop {cpu}",
+        "specs": {"ram": ram, "storage": storage},
+    }
+    for i, (brand, cpu, ram, storage) in enumerate(
+        itertools.product(
+            ["hp", "dell", "lenovo"],
+            ["core i3", "core i5", "core i7"],
+            ["8gb ram", "16gb ram"],
+            ["256gb ssd", "512gb ssd", "1tb hdd"],
+        )
+    )
+]
+
+
+def product_text(product):
+    return " ".join([product["name"], *product["specs"].values()])
+
+
+@pytest.fixture
+def engine():
+    engine = SearchEngine(data_fetcher=None, dump_path=None, skip_init=True)
+    vectors = np.random.RandomState(0).rand(200, 16)
+    engine.vectors = {
+        "vectors": vectors,
+        "ids": np.arange(1000, 1200),
+        "normalized": normalize(vectors),
+    }
+    return engine
+
+
+@pytest.fixture
+def search_engine(make_engine):
+    return make_engine(PRODUCTS, product_text)
+
+
+def test_cluster_pipe(engine):
+    encoded = np.random.RandomState(1).rand(3, 16)
+
+    data = engine.cluster_pipe(encoded=encoded, k=20)
+
+    scores = cosine_similarity(encoded, engine.vectors["vectors"])
+    expected = np.argsort(-scores.mean(axis=0))[:20] + 1000
+    assert data["ids"] == expected.tolist()
+
+
+def test_cluster_pipe_centroid(engine):
+    encoded = np.random.RandomState(2).rand(7, 16)
+
+    centroid = engine.cluster_pipe(encoded=encoded, k=50)
+    engine.scoring = "mean"
+    mean = engine.cluster_pipe(encoded=encoded, k=50)
+
+    assert centroid["ids"] == mean["ids"]
+
+
+def test_cluster_pipe_ivf(engine):
+    engine.index = "ivf"
+    engine.ann = IVFIndex.build(engine.vectors["normalized"], n_lists=4)
+    engine.nprobe = 4
+    encoded = np.random.RandomState(3).rand(3, 16)
+
+    approx = engine.cluster_pipe(encoded=encoded, k=20)
+    engine.index = "exact"
+    exact = engine.cluster_pipe(encoded=encoded, k=20)
+
+    assert approx["ids"] == exact["ids"]
+
+
+def test_search_many(search_engine):
+    keywords_list = [
+        ["core i5", "16gb ram"],
+        ["dell", "512gb ssd", "core i7"],
+        ["hp laptop"],
+    ]
+
+    results = search_engine.search_many(keywords_list, cluster_size=5, k=10)
+
+    assert len(results) == 3
+    for keywords, products in zip(keywords_list, results):
+        assert products == search_engine.search(keywords, 5, 10)
+
+
+def test_result_cache(search_engine):
+    search_engine.ids_cache = LRUCache(10)
+    search_engine.results_cache = LRUCache(10)
+    calls = []
+    data_fetcher = search_engine.data_fetcher
+
+    def counting_data_fetcher(ids):
+        calls.append(ids)
+        return data_fetcher(ids)
+
+    search_engine.data_fetcher = counting_data_fetcher
+
+    products = search_engine.search(["Core i5", "16gb  RAM"], 5, 10)
+    assert search_engine.search(["core i5", "16gb ram"], 5, 10) == products
+    assert len(calls) == 1
+
+    # same retrieval, different ordering
+    search_engine.encoder = None
+    search_engine.search(["core i5", "16gb ram"], 2, 10)
+    assert calls[1] == calls[0]
+
+    search_engine.invalidate()
+    assert len(search_engine.ids_cache) == 0
+    assert len(search_engine.results_cache) == 0
+
+
+def test_cache_key(search_engine):
+    key = search_engine.cache_key(["Core i5", "16gb  RAM"], 10)
+
+    assert search_engine.cache_key(["core i5!", " 16gb ram"], 10) == key
+    # the preprocessor joins the words around tabs and newlines
+    assert search_engine.cache_key(["core i5", "16gb\tram"], 10) != key
+    assert search_engine.cache_key(["core\ni5", "16gbram"], 10) == (
+        ("corei5", "16gbram"),
+        10,
+    )
+
+
+def test_fetch_keeps_order(search_engine):
+    data_fetcher = search_engine.data_fetcher
+    search_engine.data_fetcher = lambda ids: data_fetcher(sorted(ids))
+
+    assert [i["id"] for i in search_engine.fetch([5, 2, 9])] == [5, 2, 9]
+
+    search_engine.product_cache = ProductCache(maxsize=10)
+    assert [i["id"] for i in search_engine.fetch([9, 2])] == [9, 2]
+    assert [i["id"] for i in search_engine.fetch([2, 7, 9])] == [2, 7, 9]
+    assert search_engine.product_cache.stats()["hits"] == 2
+
+
+def test_async_search(search_engine):
+    keywords = ["core i5", "16gb ram", "ssd"]
+    expected = search_engine.search(keywords, cluster_size=5, k=20)
+
+    data_fetcher = search_engine.data_fetcher
+    events = []
+
+    async def async_data_fetcher(ids):
+        events.append(("fetch", ids[0]))
+        await asyncio.sleep(0)
+        return data_fetcher(ids)
+
+    products = asyncio.run(
+        search_engine.async_search(
+            keywords, cluster_size=5, k=20, data_fetcher=async_data_fetcher
+        )
+    )
+
+    assert products == expected
+    # one fetch per cluster
+    assert len(events) == 4
+
+
+def test_async_search_sync_data_fetcher(search_engine):
+    keywords = ["dell", "core i7"]
+    expected = search_engine.search(keywords, cluster_size=3, k=10)
+
+    products = asyncio.run(
+        search_engine.async_search(keywords, cluster_size=3, k=10)
+    )
+
+    assert products == expected
+
+
+def test_async_search_custom_data_fetcher(search_engine):
+    keywords = ["dell", "core i7"]
+    expected = search_engine.search(keywords, cluster_size=3, k=10)
+
+    # results of another data_fetcher are not cached
+    products = asyncio.run(
+        search_engine.async_search(
+            keywords, cluster_size=3, k=10, data_fetcher=lambda ids: []
+        )
+    )
+    assert products == []
+    assert search_engine.search(keywords, cluster_size=3, k=10) == expected
+
+
+def test_dropped_ids(search_engine):
+    keywords = ["core i5", "16gb ram", "ssd"]
+    data_fetcher = search_engine.data_fetcher
+    search_engine.data_fetcher = lambda ids: [
+        i for i in data_fetcher(ids) if i["id"] % 3
+    ]
+    search_engine.results_cache = None
+    expected = search_engine.search(keywords, cluster_size=5, k=20)
+
+    # the clusters are sliced from the fetched products on every path
+    clusters = list(search_engine.search_iter(keywords, cluster_size=5, k=20))
+    products = asyncio.run(
+        search_engine.async_search(keywords, cluster_size=5, k=20)
+    )
+
+    assert [len(i) for i in clusters[:-1]] == [5] * (len(clusters) - 1)
+    assert [i for cluster in clusters for i in cluster] == expected
+    assert products == expected
+
+
+def test_search_iter(search_engine):
+    keywords = ["core i5", "16gb ram", "ssd"]
+    expected = search_engine.search(keywords, cluster_size=5, k=20)
+
+    data_fetcher = search_engine.data_fetcher
+    calls = []
+
+    def counting_data_fetcher(ids):
+        calls.append(list(ids))
+        return data_fetcher(ids)
+
+    search_engine.data_fetcher = counting_data_fetcher
+    clusters = search_engine.search_iter(keywords, cluster_size=5, k=20)
+
+    # only the first cluster is fetched for the first page
+    first = next(clusters)
+    assert len(calls) == 1
+    assert len(calls[0]) == 5
+    assert first == expected[:5]
+
+    rest = [i for cluster in clusters for i in cluster]
+    assert first + rest == expected
+    assert len(calls) == 4
+
+
+def test_process_ranker(search_engine):
+    keywords_list = [["core i5", "16gb ram"], ["dell", "ssd"]]
+    expected = search_engine.search_many(keywords_list, cluster_size=4, k=12)
+
+    search_engine.ranker = ProcessRanker(search_engine, 2)
+    try:
+        many = search_engine.search_many(keywords_list, cluster_size=4, k=12)
+        single = search_engine.search(keywords_list[0], cluster_size=4, k=12)
+    finally:
+        search_engine.close()
+
+    assert many == expected
+    assert single == expected[0]
+    assert search_engine.ranker is None
+
+
+def test_explain(search_engine):
+    keywords = ["core i5", "16gb ram"]
+    expected = search_engine.search(keywords, cluster_size=4, k=12)
+
+    data = search_engine.pipe(
+        keywords=keywords, cluster_size=4, k=12, explain=True
+    )
+
+    assert data["products"] == expected
+    assert len(data["sources"]) == 12
+    assert (
+        search_engine.pipe(keywords=keywords, cluster_size=4, k=12)["sources"]
+        is None
+    )
+
+
+def test_upsert_and_delete(search_engine):
+    keywords = ["dell", "core i7", "16gb ram"]
+    before = [i["id"] for i in search_engine.search(keywords, 5, 5)]
+
+    # a new product matching the keywords best, and a delisted one
+    product = {"id": 1000, "name": "dell laptop core i7 16gb ram"}
+    search_engine.data_fetcher = lambda ids, f=search_engine.data_fetcher: [
+        product if i == 1000 else f([i])[0] for i in ids
+    ]
+    search_engine.upsert([1000], [product["name"]])
+    search_engine.delete([before[1]])
+
+    after = [i["id"] for i in search_engine.search(keywords, 5, 5)]
+    assert 1000 in after
+    assert before[1] not in after
+    assert len(after) == 5
+
+    many = search_engine.search_many([keywords], 5, 5)
+    assert [i["id"] for i in many[0]] == after
+
+    # compaction gives the same results from the merged vectors
+    search_engine.compact(wait=False).join()
+    assert search_engine.delta is None
+    assert 1000 in search_engine.vectors["ids"].tolist()
+    assert before[1] not in search_engine.vectors["ids"].tolist()
+    compacted = [i["id"] for i in search_engine.search(keywords, 5, 5)]
+    assert compacted == after
+
+
+def test_write_while_compacting(search_engine):
+    search_engine.upsert([1000], ["dell laptop core i7 16gb ram"])
+
+    stop = threading.Event()
+
+    def write():
+        for i in itertools.count(2000):
+            if stop.is_set():
+                break
+            search_engine.delete([i])
+
+    # switching threads often, so the writes interleave with the merge
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        for i in range(5):
+            # many tombstones, merged while the writes go on
+            start = (i + 1) * 10**6
+            search_engine.delete(range(start, start + 10**5))
+            search_engine.compact()
+    finally:
+        stop.set()
+        thread.join()
+        sys.setswitchinterval(interval)
+
+    assert 1000 in search_engine.vectors["ids"].tolist()
+    assert len(search_engine.vectors["ids"]) == len(PRODUCTS) + 1
+
+
+def test_compact_store(search_engine, tmp_path):
+    # vectors mapped from the dump folder are written back to their store
+    store = VectorStore(str(tmp_path / "vectors"))
+    vectors = search_engine.vectors
+    store.write(vectors["vectors"], vectors["ids"], v=1)
+    search_engine.vectors = store.read()
+    search_engine.dump_path = str(tmp_path)
+
+    search_engine.upsert([1000], ["dell laptop core i7 16gb ram"])
+    search_engine.compact()
+
+    assert isinstance(search_engine.vectors["normalized"], np.memmap)
+    assert store.header()["v"] == 1
+    assert store.header()["n"] == len(PRODUCTS) + 1
+    assert search_engine.vectors["ids"][-1] == 1000
+
+
+def test_upsert_ivf(search_engine):
+    encoded = search_engine.encoder.encode(["lenovo core i3"]).toarray()
+
+    def search(index):
+        search_engine.index = index
+        ids = search_engine.cluster_pipe(encoded=encoded, k=10)["ids"]
+
+        # scores of the results, ids of equal scores may differ
+        vectors, _, delta = search_engine.view()
+        if delta is not None:
+            vectors = delta.merge(vectors)
+        rows = [vectors["ids"].tolist().index(i) for i in ids]
+        scores = search_engine.scores(encoded, vectors["normalized"][rows])
+        return ids, np.round(scores, 6).tolist()
+
+    search_engine.ann = IVFIndex.build(
+        search_engine.vectors["normalized"], n_lists=4
+    )
+    # probing every list, the results are the exact ones
+    search_engine.nprobe = 4
+
+    search_engine.upsert([0], ["lenovo laptop core i3 8gb ram 1tb hdd"])
+    search_engine.delete([1])
+
+    ids, expected = search("exact")
+    assert 1 not in ids
+    assert ids.count(0) == 1
+    assert search("ivf")[1] == expected
+
+    search_engine.compact()
+    assert search_engine.delta is None
+    assert search_engine.ann.n_lists == int(np.sqrt(len(PRODUCTS) - 1))
+    search_engine.nprobe = search_engine.ann.n_lists
+    assert search("ivf")[1] == expected
+    assert search("exact")[1] == expected
+
+
+@pytest.mark.parametrize("scoring", ["centroid", "mean"])
+def test_sharded(search_engine, scoring):
+    search_engine.scoring = scoring
+    keywords_list = [["core i5", "16gb ram"], ["dell", "ssd"]]
+    expected = search_engine.search_many(keywords_list, cluster_size=4, k=12)
+
+    search_engine.index = "sharded"
+    search_engine.init_shards()
+    try:
+        single = search_engine.search(keywords_list[0], cluster_size=4, k=12)
+        many = search_engine.search_many(keywords_list, cluster_size=4, k=12)
+
+        # tombstones are filtered from the merged top-k
+        deleted = single[0]["id"]
+        search_engine.delete([deleted])
+        ids = search_engine.cluster_pipe(
+            **search_engine.vectorizer_pipe(keywords=keywords_list[0], k=12)
+        )["ids"]
+
+        # a search holding the index replaced by compaction still runs
+        _, old_ann, _ = search_engine.view()
+        search_engine.compact()
+        query = search_engine.shard_query(
+            search_engine.vectorizer_pipe(keywords=keywords_list[0])["encoded"]
+        )
+        old_ids = old_ann.search([query], 12)[0][0].tolist()
+        compacted = search_engine.search(
+            keywords_list[0], cluster_size=4, k=12
+        )
+    finally:
+        search_engine.close()
+
+    assert single == expected[0]
+    assert many == expected
+    assert deleted not in ids
+    assert len(ids) == 12
+    assert deleted in old_ids
+    assert deleted not in [i["id"] for i in compacted]
+    with pytest.raises(ValueError, match="closed"):
+        old_ann.search([query], 12)
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from pricegram_search.products import map_products
+from pricegram_search.products import ProductCache
+from pricegram_search.products import ProductTextIndex
+from pricegram_search.utils import ProductsMatch
+
+
+def test_product_text_index():
+    calls = []
+
+    def cleaner(product):
+        calls.append(product["id"])
+        return ProductsMatch().cleaned_parts(product)
+
+    index = ProductTextIndex(cleaner, maxsize=10)
+    product = {"id": 1, "name": "HP Core-i5", "tags": ["16GB RAM"]}
+
+    assert index.parts(product) == ("id1", "namehpcorei5", "16gbram")
+    assert index.parts(product) == ("id1", "namehpcorei5", "16gbram")
+    assert calls == [1]
+
+    index.invalidate([1])
+    index.parts(product)
+    assert calls == [1, 1]
+
+    # an updated product is cleaned again, without invalidating it
+    updated = dict(product, name="HP Core-i7")
+    assert index.parts(updated) == ("id1", "namehpcorei7", "16gbram")
+    assert calls == [1, 1, 1]
+
+
+def test_product_text_index_bulk():
+    index = ProductTextIndex(ProductsMatch().cleaned_parts, maxsize=2)
+    index.add([{"id": i, "name": "ram"} for i in range(3)])
+    assert len(index) == 2
+
+    # products without an id are not kept
+    assert index.parts({"name": "SSD"}) == ["namessd"]
+    assert len(index) == 2
+
+    index.invalidate()
+    assert len(index) == 0
+
+
+def test_sort_products_batch_index():
+    products_match = ProductsMatch()
+    products = [{"id": i, "name": f"core i{i}"} for i in (3, 5, 7)]
+    expected = products_match.sort_products_batch(products, ["core i7"])
+
+    products_match.product_index = ProductTextIndex(
+        products_match.cleaned_parts
+    )
+    assert products_match.sort_products_batch(products, ["core i7"]) == (
+        expected
+    )
+    assert len(products_match.product_index) == 3
+
+    # the updated text of a product is ranked, not the indexed one
+    products[0] = {"id": 3, "name": "core i7 16gb"}
+    ranked, scores, _ = products_match.sort_products_batch(
+        products, ["core i7 16gb"]
+    )
+    assert ranked[0] == products[0]
+    assert (
+        scores == products_match.sort_products(products, ["core i7 16gb"])[1]
+    )
+
+
+def test_map_products():
+    products = [{"id": 2}, {"id": 1}]
+    assert map_products([1, 2, 3], products) == {
+        1: products[1],
+        2: products[0],
+    }
+
+    # without ids, products are assumed to be in the order of the ids
+    products = [{"name": "a"}, {"name": "b"}]
+    assert map_products([1, 2], products) == {1: products[0], 2: products[1]}
+
+
+def test_product_cache():
+    calls = []
+
+    def data_fetcher(ids):
+        calls.append(ids)
+        # returned in a different order than requested
+        return [{"id": i, "name": f"product {i}"} for i in sorted(ids)]
+
+    cache = ProductCache(maxsize=10)
+    assert [i["id"] for i in cache.fetch([3, 1], data_fetcher)] == [3, 1]
+    assert [i["id"] for i in cache.fetch([2, 3, 1], data_fetcher)] == [2, 3, 1]
+    assert calls == [[3, 1], [2]]
+
+    cache.invalidate([3])
+    cache.fetch([1, 3], data_fetcher)
+    assert calls[-1] == [3]
+
+
+def test_product_cache_bytes():
+    def data_fetcher(ids):
+        return [{"id": i, "name": "x" * 1000} for i in ids]
+
+    cache = ProductCache(maxsize=100, max_bytes=5000)
+    cache.fetch(list(range(20)), data_fetcher)
+
+    assert 0 < cache.stats()["bytes"] <= 5000
+    assert len(cache.products) < 20
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import pytest
+
+from pricegram_search.ranker import pack
+from pricegram_search.ranker import ProcessRanker
+from pricegram_search.ranker import unpack
+from pricegram_search.utils import ProductsMatch
+
+PRODUCTS = [
+    {"name": "hp laptop core i5", "specs": {"ram": "8gb"}},
+    {"name": "dell laptop core i7", "specs": {"ram": "16gb"}},
+    {},
+    {"name": "lenovo laptop core i5", "specs": {"ram": "16gb"}},
+]
+
+
+@pytest.fixture(scope="module")
+def ranker():
+    ranker = ProcessRanker(ProductsMatch(), 2)
+    yield ranker
+    ranker.close()
+
+
+def test_pack_roundtrip():
+    parts = ["namehp", "", "ram8gb"]
+    counts = [2, 0, 1]
+
+    unpacked, unpacked_counts = unpack(*pack(parts, counts))
+
+    assert unpacked == parts
+    assert unpacked_counts.tolist() == counts
+
+
+def test_pack_empty():
+    parts, counts = unpack(*pack([], [0, 0]))
+
+    assert parts == []
+    assert counts.tolist() == [0, 0]
+
+
+def test_sort_matches_sort_products_batch(ranker):
+    matcher = ProductsMatch()
+    batches = [
+        (PRODUCTS, ["core i5", "16gb"]),
+        (PRODUCTS[:2], ["dell"]),
+        ([], ["hp"]),
+    ]
+
+    results = ranker.sort(batches)
+
+    assert len(results) == len(batches)
+    for (products, keywords), (ranked, scores) in zip(batches, results):
+        expected = matcher.sort_products_batch(products, keywords)
+        assert ranked == expected[0]
+        assert scores == expected[1]
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import numpy as np
+from sklearn.preprocessing import normalize as sk_normalize
+
+from pricegram_search.retrieval import centroid
+from pricegram_search.retrieval import normalize
+from pricegram_search.retrieval import top_k
+
+
+def test_normalize():
+    matrix = np.random.RandomState(0).rand(10, 4)
+    assert np.allclose(normalize(matrix, chunk_size=3), sk_normalize(matrix))
+    assert normalize(matrix).dtype == np.float32
+
+
+def test_normalize_zero_row():
+    assert normalize([[0.0, 0.0], [3.0, 4.0]]).tolist() == [
+        [0.0, 0.0],
+        [0.6000000238418579, 0.800000011920929],
+    ]
+
+
+def test_top_k():
+    scores = np.random.RandomState(0).rand(100)
+    assert top_k(scores, 10).tolist() == np.argsort(-scores)[:10].tolist()
+
+
+def test_top_k_bounds():
+    assert top_k([0.1, 0.3, 0.2], 5).tolist() == [1, 2, 0]
+    assert top_k([0.1, 0.3, 0.2], 0).tolist() == []
+
+
+def test_centroid():
+    encoded = np.random.RandomState(0).rand(7, 4)
+    matrix = normalize(np.random.RandomState(1).rand(30, 4))
+
+    scores = (normalize(encoded) @ matrix.T).mean(axis=0)
+    assert np.allclose((centroid(encoded) @ matrix.T)[0], scores)
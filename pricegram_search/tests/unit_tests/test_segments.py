@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import numpy as np
+
+from pricegram_search.segments import DeltaSegment
+
+
+def test_upsert_replaces_rows():
+    delta = DeltaSegment(3, capacity=1)
+
+    delta.upsert([1, 2], np.eye(3)[:2])
+    delta.upsert([2, 3, 3], np.eye(3)[[0, 1, 2]] * 2)
+    view = delta.view()
+
+    rows = view.rows()
+    assert [view.ids[i] for i in rows] == [1, 2, 3]
+    np.testing.assert_array_equal(
+        view.vectors[rows], [[1, 0, 0], [2, 0, 0], [0, 0, 2]]
+    )
+    np.testing.assert_allclose(view.normalized[rows][2], [0, 0, 1])
+    assert len(view) == 3
+
+
+def test_delete():
+    delta = DeltaSegment(3).upsert([1, 2], np.eye(3)[:2])
+    before = delta.view()
+
+    delta.delete([2, 7])
+    view = delta.view()
+
+    assert [view.ids[i] for i in view.rows()] == [1]
+    assert len(view) == 3
+    assert view.alive([7, 8]).tolist() == [False, True]
+    # views keep the state they were taken in
+    assert [before.ids[i] for i in before.rows()] == [1, 2]
+    assert before.alive([7]).tolist() == [True]
+
+
+def test_view_after_growth():
+    delta = DeltaSegment(3, capacity=1).upsert([1], np.ones((1, 3)))
+    view = delta.view()
+
+    delta.upsert([1, 2, 3], np.eye(3))
+
+    np.testing.assert_array_equal(view.vectors[view.rows()], np.ones((1, 3)))
+
+
+def test_merge():
+    vectors = {
+        "vectors": np.arange(12, dtype=np.float32).reshape(4, 3),
+        "ids": np.array([10, 11, 12, 13]),
+    }
+    vectors["normalized"] = vectors["vectors"]
+    delta = DeltaSegment(3).upsert([11, 20], np.ones((2, 3)))
+    delta.delete([13])
+
+    merged = delta.view().merge(vectors)
+
+    assert merged["ids"].tolist() == [10, 12, 11, 20]
+    np.testing.assert_array_equal(merged["vectors"][1], [6, 7, 8])
+    np.testing.assert_array_equal(merged["vectors"][2:], np.ones((2, 3)))
+    assert len(merged["normalized"]) == 4
+
+
+def test_merge_after_writes():
+    vectors = {
+        "vectors": np.eye(3, dtype=np.float32),
+        "ids": np.array([10, 11, 12]),
+    }
+    vectors["normalized"] = vectors["vectors"]
+    delta = DeltaSegment(3).delete([10])
+    view = delta.view()
+
+    # writes made after the view are not merged
+    delta.delete([11, 12])
+    delta.upsert([20], np.ones((1, 3)))
+
+    assert view.merge(vectors)["ids"].tolist() == [11, 12]
+    assert view.alive([10, 11]).tolist() == [False, True]
+
+
+def test_rebase():
+    delta = DeltaSegment(3).upsert([1, 2], np.eye(3)[:2])
+    generation = delta.view().generation
+
+    delta.upsert([3], np.ones((1, 3)))
+    delta.delete([1])
+    rebased = delta.rebase(generation).view()
+
+    assert [rebased.ids[i] for i in rebased.rows()] == [3]
+    assert rebased.alive([1, 2]).tolist() == [False, True]
+    assert len(delta.rebase(delta.view().generation)) == 0
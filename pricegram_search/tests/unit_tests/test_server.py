@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+import numpy as np
+import pytest
+
+from pricegram_search.server import PreforkServer
+from pricegram_search.server import share_array
+
+PRODUCTS = [
+    {"id": i, "name": f"{brand} laptop core i{cpu}"}
+    for i, (brand, cpu) in enumerate(
+        (brand, cpu) for brand in ["hp", "dell", "lenovo"] for cpu in [3, 5, 7]
+    )
+]
+
+
+@pytest.fixture
+def engine(make_engine):
+    return make_engine(PRODUCTS)
+
+
+def test_share_array():
+    array = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+    shared, block = share_array(array)
+    try:
+        np.testing.assert_array_equal(shared, array)
+        assert not shared.flags.writeable
+    finally:
+        del shared
+        block.close()
+        block.unlink()
+
+
+def test_prefork_server(engine):
+    keywords_list = [["core i5"], ["dell", "core i7"], ["hp"]]
+    expected = [engine.search(i, cluster_size=3, k=6) for i in keywords_list]
+
+    with PreforkServer(engine, 2) as server:
+        # the vectors of the parent are the shared copy
+        assert not engine.vectors["normalized"].flags.writeable
+
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            results = list(
+                executor.map(
+                    lambda i: server.search(i, cluster_size=3, k=6),
+                    keywords_list * 4,
+                )
+            )
+        many = server.search_many(keywords_list, cluster_size=3, k=6)
+
+        # errors of a worker are raised in the parent
+        with pytest.raises(AssertionError):
+            server.search([], cluster_size=3, k=6)
+
+    assert results == expected * 4
+    assert many == expected
+    assert engine.vectors["normalized"].flags.writeable
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from pricegram_search.retrieval import normalize
+from pricegram_search.retrieval import top_k
+from pricegram_search.shards import ShardedIndex
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return normalize(np.random.RandomState(0).rand(300, 8))
+
+
+@pytest.fixture(scope="module")
+def index(matrix):
+    index = ShardedIndex(matrix, np.arange(300) + 1000, n_shards=3)
+    yield index
+    index.close()
+
+
+def test_search_matches_exact(matrix, index):
+    queries = normalize(np.random.RandomState(1).rand(5, 8))
+    groups = [queries[:1], queries[1:4], queries[4:]]
+
+    results = index.search(groups, 20)
+
+    assert len(results) == len(groups)
+    for group, (ids, scores) in zip(groups, results):
+        exact = (group @ matrix.T).mean(axis=0)
+        idx = top_k(exact, 20)
+        assert ids.tolist() == (idx + 1000).tolist()
+        np.testing.assert_allclose(scores, exact[idx], rtol=1e-5)
+
+
+def test_more_shards_than_rows(matrix):
+    index = ShardedIndex(matrix[:2], np.array([1, 2]), n_shards=4)
+    try:
+        ids, scores = index.search([matrix[1:2]], 10)[0]
+        assert index.n_shards == 4
+    finally:
+        index.close()
+
+    assert ids.tolist() == [2, 1]
+
+
+def test_errors_are_raised(index):
+    with pytest.raises(ValueError):
+        index.search([np.ones((1, 3))], 5)
+
+
+def test_search_after_close(matrix):
+    index = ShardedIndex(matrix[:10], np.arange(10), n_shards=2)
+    index.close()
+
+    with pytest.raises(ValueError, match="closed"):
+        index.search([matrix[:1]], 5)
+    assert index.n_shards == 0
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from tokenizers import Tokenizer
+from tokenizers.models import WordPiece
+from tokenizers.normalizers import BertNormalizer
+from tokenizers.pre_tokenizers import BertPreTokenizer
+
+from pricegram_search import SearchEngine
+from pricegram_search.ann import IVFIndex
+from pricegram_search.inverted import InvertedIndex
+from pricegram_search.loader import BackendTokenizer
+from pricegram_search.snapshot import Snapshot
+
+TEXTS = [
+    f"{brand} laptop core i{cpu} {ram}gb ram"
+    for brand in ["hp", "dell", "lenovo"]
+    for cpu in [3, 5, 7]
+    for ram in [8, 16]
+]
+
+VOCAB = [
+    "[UNK]",
+    "hp",
+    "dell",
+    "lenovo",
+    "laptop",
+    "core",
+    "i",
+    "##3",
+    "##5",
+    "##7",
+    "8",
+    "16",
+    "##gb",
+    "ram",
+]
+
+
+def bert_tokenizer():
+    tokenizer = Tokenizer(
+        WordPiece({t: i for i, t in enumerate(VOCAB)}, unk_token="[UNK]")
+    )
+    tokenizer.normalizer = BertNormalizer()
+    tokenizer.pre_tokenizer = BertPreTokenizer()
+    return BackendTokenizer(tokenizer)
+
+
+@pytest.fixture
+def engine(make_engine):
+    engine = make_engine(
+        [{"id": i, "name": text} for i, text in enumerate(TEXTS)],
+        vectorizer=TfidfVectorizer(
+            tokenizer=bert_tokenizer(), token_pattern=None
+        ),
+    )
+    engine.bert_tokenizer = engine.vectorizer.tokenizer
+    engine.versions = {"vectors": 1}
+    engine.post_init()
+    return engine
+
+
+def test_roundtrip(engine, tmp_path):
+    path = str(tmp_path / "engine.snapshot")
+    engine.save_snapshot(path)
+
+    loaded = SearchEngine.from_snapshot(path, engine.data_fetcher, verbose=0)
+
+    assert Snapshot(path).header()["versions"] == {"vectors": 1}
+    assert isinstance(loaded.vectors["normalized"], np.memmap)
+    assert loaded.vectorizer.vocabulary_ == engine.vectorizer.vocabulary_
+    np.testing.assert_array_equal(
+        loaded.vectorizer.idf_, engine.vectorizer.idf_
+    )
+    assert loaded.bert_tokenizer("Dell Core i7") == [
+        "dell",
+        "core",
+        "i",
+        "##7",
+    ]
+
+    for keywords in [["core i5"], ["dell", "16gb ram"], ["lenovo"]]:
+        assert loaded.search(keywords, 4, 8) == engine.search(keywords, 4, 8)
+
+
+def test_vectorizer_params(tmp_path):
+    vectorizer = TfidfVectorizer(
+        ngram_range=(1, 2), use_idf=False, stop_words=["laptop"]
+    ).fit(TEXTS)
+    vectors = vectorizer.transform(TEXTS).toarray()
+    path = str(tmp_path / "engine.snapshot")
+
+    Snapshot(path).write(
+        vectorizer,
+        {"vectors": vectors, "ids": list(TEXTS), "normalized": vectors},
+    )
+    snapshot = Snapshot(path).read()
+
+    assert snapshot["tokenizer_state"] is None
+    assert snapshot["vectors"]["ids"].tolist() == TEXTS
+    diff = snapshot["vectorizer"].transform(TEXTS) - vectorizer.transform(
+        TEXTS
+    )
+    assert abs(diff).max() == 0
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / "engine.snapshot"
+    path.write_bytes(b"not a snapshot")
+
+    assert Snapshot(str(path)).header() == {}
+    assert not Snapshot(str(tmp_path / "missing")).exists()
+
+
+def test_load_without_transformers(engine, tmp_path):
+    path = str(tmp_path / "engine.snapshot")
+    engine.save_snapshot(path)
+
+    code = (
+        "import sys\n"
+        "from pricegram_search import SearchEngine\n"
+        f"SearchEngine.from_snapshot({path!r}, None, verbose=0)\n"
+        "print('transformers' in sys.modules)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    assert output.strip() == "False"
+
+
+@pytest.mark.parametrize("index", ["ivf", "sparse"])
+def test_index(engine, tmp_path, monkeypatch, index):
+    engine.index = index
+    engine.n_lists = 4
+    engine.ann = engine.build_index(engine.vectors["normalized"])
+    path = str(tmp_path / "engine.snapshot")
+    engine.save_snapshot(path)
+
+    # the index is mapped from the snapshot, not built again
+    def build(*args, **kwargs):
+        raise AssertionError("index built")
+
+    monkeypatch.setattr(IVFIndex, "build", build)
+    monkeypatch.setattr(InvertedIndex, "build", build)
+    loaded = SearchEngine.from_snapshot(
+        path, engine.data_fetcher, verbose=0, index=index, n_lists=4
+    )
+
+    assert type(loaded.ann) is type(engine.ann)
+    arrays, meta = loaded.ann.state()
+    assert meta == engine.ann.state()[1]
+    assert any(isinstance(i, np.memmap) for i in arrays.values())
+    for keywords in [["core i5"], ["dell", "16gb ram"], ["lenovo"]]:
+        assert loaded.search(keywords, 4, 8) == engine.search(keywords, 4, 8)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import http.server
+import threading
+
+import pytest
+
+from pricegram_search.sources import content_size
+from pricegram_search.sources import get_source
+from pricegram_search.sources import HTTPSource
+from pricegram_search.sources import LocalSource
+from pricegram_search.sources import remove_parts
+from pricegram_search.sources import sha256
+
+CONTENT = bytes(range(256)) * 64
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    root = tmp_path / "mirror"
+    root.mkdir()
+    (root / "vectors.json").write_bytes(CONTENT)
+    return root
+
+
+def test_sha256(mirror):
+    expected = hashlib.sha256(CONTENT).hexdigest()
+
+    assert sha256(str(mirror / "vectors.json")) == expected
+
+
+def test_get_source(mirror):
+    assert isinstance(get_source(str(mirror)), LocalSource)
+    assert get_source(f"file://{mirror}").root == str(mirror)
+    assert isinstance(get_source("https://example.com/a"), HTTPSource)
+
+    source = LocalSource(str(mirror))
+    assert get_source(source) is source
+
+
+def test_local_source_resume(mirror, tmp_path):
+    path = tmp_path / "vectors.json"
+    # an interrupted copy of the first bytes
+    (tmp_path / "vectors.json.part").write_bytes(CONTENT[:1000])
+
+    size = LocalSource(str(mirror)).fetch({"path": "vectors.json"}, str(path))
+
+    assert size == len(CONTENT)
+    assert path.read_bytes() == CONTENT
+    assert not (tmp_path / "vectors.json.part").exists()
+
+
+def test_http_source(mirror, tmp_path):
+    handler = functools.partial(
+        http.server.SimpleHTTPRequestHandler, directory=str(mirror)
+    )
+    handler.log_message = lambda *args: None
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    path = tmp_path / "vectors.json"
+    # a stale part, the server ignores ranges and sends the whole file
+    (tmp_path / "vectors.json.part").write_bytes(b"stale")
+    try:
+        source = HTTPSource(f"http://127.0.0.1:{server.server_port}")
+        size = source.fetch({"path": "vectors.json"}, str(path))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert size == len(CONTENT)
+    assert path.read_bytes() == CONTENT
+
+
+def test_content_size():
+    assert content_size({"Content-Length": "10"}) == 10
+    assert content_size({"Content-Length": "10"}, offset=5) == 15
+    assert content_size({"Content-Range": "bytes 5-14/15"}, offset=5) == 15
+    assert content_size({"Content-Range": "bytes 5-14/*"}) is None
+    assert content_size({}) is None
+
+
+def test_remove_parts(tmp_path):
+    path = tmp_path / "vectors.json"
+    for name in ["vectors.json.part", "vectors.json1x.part", "other.part"]:
+        (tmp_path / name).write_bytes(b"")
+
+    remove_parts(str(path))
+
+    assert [i.name for i in tmp_path.iterdir()] == ["other.part"]
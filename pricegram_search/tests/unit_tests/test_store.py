@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import concurrent.futures
+import json
+
+import numpy as np
+import pytest
+
+from pricegram_search.store import replacing
+from pricegram_search.store import save_array
+from pricegram_search.store import VectorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return VectorStore(str(tmp_path / "vectors"))
+
+
+def test_write_read(store):
+    vectors = [[1.0, 0.0], [0.5, 0.5], [0.0, 2.0]]
+    store.write(vectors, [10, 20, 30], v=1)
+
+    data = store.read()
+    assert isinstance(data["vectors"], np.memmap)
+    assert data["vectors"].dtype == np.float32
+    assert data["vectors"].shape == (3, 2)
+    assert data["ids"].tolist() == [10, 20, 30]
+    assert store.header()["v"] == 1
+    assert np.allclose(np.linalg.norm(data["normalized"], axis=1), 1)
+
+
+def test_missing_store(store):
+    assert not store.exists()
+    assert store.header() == {}
+
+
+def test_convert_json(store, tmp_path):
+    json_path = tmp_path / "vectors.json"
+    with open(json_path, "w") as f:
+        json.dump({"vectors": [[0.1, 0.2]], "ids": ["a1"]}, f)
+
+    store.convert_json(str(json_path), v=3)
+
+    data = store.read()
+    assert np.allclose(data["vectors"], [[0.1, 0.2]])
+    assert data["ids"].tolist() == ["a1"]
+    assert store.exists()
+    assert store.header()["v"] == 3
+
+
+def test_concurrent_save_array(tmp_path):
+    # workers of a host building the same file at once
+    path = str(tmp_path / "normalized.npy")
+    arrays = [np.full((200, 256), i, dtype=np.float32) for i in range(8)]
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda array: save_array(path, array), arrays))
+
+    saved = np.load(path)
+    assert (saved == saved[0, 0]).all()
+    assert [i.name for i in tmp_path.iterdir()] == ["normalized.npy"]
+
+
+def test_replacing_error(tmp_path):
+    path = tmp_path / "header.json"
+    path.write_text("{}")
+
+    with pytest.raises(ValueError):
+        with replacing(str(path), "w") as f:
+            f.write("{")
+            raise ValueError
+
+    assert path.read_text() == "{}"
+    assert [i.name for i in tmp_path.iterdir()] == ["header.json"]
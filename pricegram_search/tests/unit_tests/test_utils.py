@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import random
+
 import pytest
 
 from pricegram_search.utils import ProductsMatch
@@ -74,5 +76,76 @@ def test_product_keywords():
     assert scores == [1.0, 1.0]
 
 
+def test_product_keywords_explain():
+    products_match = ProductsMatch()
+    product = {"name": "laptop", "specs": {"ram": "16gb"}, "tags": ["i7"]}
+
+    scores, sources = products_match.product_keywords(
+        product, ["ram 16gb", "core i7"]
+    )
+    assert sources is None
+
+    explained, sources = products_match.product_keywords(
+        product, ["ram 16gb", "core i7"], explain=True
+    )
+    assert explained == scores
+    assert sources[0].startswith("ram16gb ram16gb")
+    assert sources[1].startswith("corei7 i7")
+
+
+def test_sort_products():
+    products_match = ProductsMatch()
+    products = [{"name": "hp core i3"}, {"name": "dell core i7 16gb"}]
+
+    products_, scores, sources = products_match.sort_products(
+        products, ["core i7", "16gb"]
+    )
+    assert products_ == products[::-1]
+    assert scores == sorted(scores, reverse=True)
+    assert sources is None
+
+    _, explained, sources = products_match.sort_products(
+        products, ["core i7", "16gb"], explain=True
+    )
+    assert explained == scores
+    assert len(sources) == 2 and sources[0].count("\n") == 1
+
+
+def test_sort_products_batch():
+    rng = random.Random(0)
+    words = ["hp", "dell", "core i5", "core i7", "16gb", "8gb", "ssd", "ram"]
+
+    def text():
+        return " ".join(rng.sample(words, rng.randint(1, 3)))
+
+    products = [
+        {
+            "name": text(),
+            "specs": {"ram": text(), "storage": text()},
+            "tags": [text() for _ in range(rng.randint(0, 2))],
+        }
+        for _ in range(30)
+    ]
+    products.append({"tags": []})
+    keywords = ["core i7", "16gb ram", "ssd", "hp core i7 16gb"]
+
+    products_match = ProductsMatch()
+    expected = products_match.sort_products(products[:-1], keywords)
+    batch = products_match.sort_products_batch(products[:-1], keywords)
+    assert batch[0] == expected[0]
+    assert batch[1] == expected[1]
+
+    # explaining falls back to `sort_products`
+    assert products_match.sort_products_batch(
+        products[:-1], keywords, explain=True
+    ) == products_match.sort_products(products[:-1], keywords, explain=True)
+
+    # products without any part score zero
+    products_, scores, _ = products_match.sort_products_batch(
+        products, keywords
+    )
+    assert products_[-1] == {"tags": []} and scores[-1] == 0
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -5,7 +5,8 @@ import itertools
 import re
 
 import numpy as np
-from thefuzz import fuzz
+
+from .matcher import find_matching_parts
 
 
 class BasicUtils:
@@ -13,21 +14,9 @@ class BasicUtils:
         return re.sub(r"[^0-9a-zA-Z]", "", text.lower())
 
     def find_matching_parts(self, input_string, substring):
-        matched_parts = []
-        start = 0
-        while start < len(substring):
-            found = False
-            for end in range(len(substring), start, -1):
-                if substring[start:end] in input_string:
-                    matched_parts.append(substring[start:end])
-                    start = end
-                    found = True
-                    break
-            if not found:
-                start += 1
-            if start >= len(substring):
-                break
-        return matched_parts
+        # greedy longest matches of `substring` parts in `input_string`,
+        # found in linear time with a suffix automaton of `input_string`
+        return find_matching_parts(input_string, substring)
 
     def get_all_combinations(self, input_list):
         all_combinations = []
@@ -37,7 +26,7 @@ class BasicUtils:
 
 
 class Algorithms(BasicUtils):
-    def matching_ratio(self, text, pattern):
+    def matching_ratio(self, text, pattern, explain=False):
         matches = self.find_matching_parts(text, pattern)
         matches = [i for i in matches if len(i) > 1]
 
@@ -45,88 +34,192 @@ class Algorithms(BasicUtils):
         n_matches = max(len(matches), 1)
 
         score = concat_ratio / n_matches
-        source = f"{pattern} {'-'.join(matches)} {concat_ratio}-{score} {text}"
+
+        source = None
+        if explain:
+            source = (
+                f"{pattern} {'-'.join(matches)} {concat_ratio}-{score} {text}"
+            )
 
         return score, source
 
-    def fuzz_ratio(self, text, pattern):
+    def fuzz_ratio(self, text, pattern, explain=False):
+        # imported only when this algorithm is selected
+        from thefuzz import fuzz
+
         score = fuzz.partial_ratio(text, pattern)
-        source = f"{pattern} {text}"
+        source = f"{pattern} {text}" if explain else None
         return score, source
 
-    def algorithm(self, text, pattern):
+    def algorithm(self, text, pattern, explain=False):
         algorithm = self.matching_ratio
         # algorithm = self.fuzz_ratio
 
-        return algorithm(text, pattern)
+        return algorithm(text, pattern, explain)
 
 
 class ProductsMatch(Algorithms):
-    def part_keyword(self, part, keyword):
-        return self.algorithm(part, keyword)
 
-    def part_keywords(self, part, keywords):
+    """Scoring and sorting products against keywords
+
+    Every method takes `explain`, when it is False (the default) only the
+    scores are computed and the sources are returned as None. With
+    `explain=True` a source string describing every match is built too.
+
+    `product_index`, a ProductTextIndex, lets `sort_products_batch` reuse
+    the cleaned parts of products it has seen before.
+    """
+
+    product_index = None
+
+    def part_keyword(self, part, keyword, explain=False):
+        return self.algorithm(part, keyword, explain)
+
+    def part_keywords(self, part, keywords, explain=False):
         part = self.clean_zero(part)
         scores = []
-        sources = []
+        sources = [] if explain else None
         for keyword in keywords:
-            score, source = self.part_keyword(part, keyword)
+            score, source = self.part_keyword(part, keyword, explain)
             scores.append(score)
-            sources.append(source)
+            if explain:
+                sources.append(source)
         return scores, sources
 
-    def product_keywords(self, product, keywords):
-        keywords = [self.clean_zero(i) for i in keywords]
-        scores = []
-        sources = []
+    def product_parts(self, product):
+        """Parts of a product that are matched against the keywords
+
+        - list values: every item is a part
+        - dict values: every key + value is a part
+        - other values: key + value is a part
+        """
+        parts = []
         for k, v in product.items():
             if isinstance(v, list):
                 for v_ in v:
-                    part = str(v_)
-                    score, source = self.part_keywords(part, keywords)
-                    scores.append(score)
-                    sources.append(source)
+                    parts.append(str(v_))
 
             elif isinstance(v, dict):
                 for k_, v_ in v.items():
-                    part = k_ + str(v_)
-                    score, source = self.part_keywords(part, keywords)
-                    scores.append(score)
-                    sources.append(source)
+                    parts.append(k_ + str(v_))
 
             else:
-                part = k + str(v)
-                score, source = self.part_keywords(part, keywords)
-                scores.append(score)
-                sources.append(source)
+                parts.append(k + str(v))
 
-        idx = np.argmax(scores, axis=0)
+        return parts
+
+    def cleaned_parts(self, product):
+        return [self.clean_zero(i) for i in self.product_parts(product)]
+
+    def product_keywords(self, product, keywords, explain=False):
+        keywords = [self.clean_zero(i) for i in keywords]
+        scores = []
+        sources = []
+        for part in self.product_parts(product):
+            score, source = self.part_keywords(part, keywords, explain)
+            scores.append(score)
+            sources.append(source)
 
-        scores = np.array(scores)[idx]
-        sources = np.array(sources)[idx]
+        # best part of the product for every keyword
+        idx = np.argmax(scores, axis=0)
+        scores = np.array(scores)
+        scores = [scores[p, i] for i, p in enumerate(idx)]
 
-        scores = [scores[i, i] for i in range(len(scores))]
-        sources = [sources[i, i] for i in range(len(sources))]
+        if not explain:
+            return scores, None
 
+        sources = [sources[p][i] for i, p in enumerate(idx)]
         return scores, sources
 
     # MAIN
-    def sort_products(self, products, keywords):
+    def sort_products(self, products, keywords, explain=False):
         scores = []
         sources = []
         for product in products:
-            score, source = self.product_keywords(product, keywords)
+            score, source = self.product_keywords(product, keywords, explain)
 
-            score = sum(score)
-            source = "\n".join(source)
-
-            scores.append(score)
-            sources.append(source)
+            scores.append(sum(score))
+            if explain:
+                sources.append("\n".join(source))
 
         idx = np.argsort(scores)[::-1]
 
         scores = [scores[i] for i in idx]
-        sources = [sources[i] for i in idx]
         products = [products[i] for i in idx]
 
+        if not explain:
+            return products, scores, None
+
+        sources = [sources[i] for i in idx]
         return products, scores, sources
+
+    def flatten_parts(self, products):
+        """Cleaned parts of all products, and the number of parts of each
+
+        Parts of a product are contiguous, in the order of `products`.
+        """
+        parts = []
+        counts = []
+        for product in products:
+            if self.product_index is not None:
+                product_parts = self.product_index.parts(product)
+            else:
+                product_parts = self.cleaned_parts(product)
+            parts.extend(product_parts)
+            counts.append(len(product_parts))
+        return parts, np.array(counts, dtype=np.int64)
+
+    def rank_parts(self, parts, counts, keywords):
+        """Sorted order and scores of products given by their flat parts
+
+        Every distinct part is scored once against every keyword, and the
+        per keyword maximum of each product is taken with one segment
+        reduction.
+        """
+        keywords = [self.clean_zero(i) for i in keywords]
+
+        # scoring the parts x keywords matrix, each distinct part once
+        unique, inverse = np.unique(
+            np.array(parts, dtype=str), return_inverse=True
+        )
+        matrix = np.array(
+            [
+                [self.part_keyword(part, keyword)[0] for keyword in keywords]
+                for part in unique.tolist()
+            ],
+            dtype=np.float64,
+        ).reshape(len(unique), len(keywords))
+        scores = matrix[inverse.reshape(-1)]
+
+        # segment max per product, over the products that have parts
+        best = np.zeros((len(counts), len(keywords)))
+        nonempty = counts > 0
+        if nonempty.any():
+            offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            best[nonempty] = np.maximum.reduceat(
+                scores, offsets[nonempty], axis=0
+            )
+
+        # summing in keyword order, same as `sort_products`
+        totals = [sum(i) for i in best.tolist()]
+
+        idx = np.argsort(totals)[::-1]
+
+        return idx, [totals[i] for i in idx]
+
+    def sort_products_batch(self, products, keywords, explain=False):
+        """Same ordering and scores as `sort_products`, for a whole cluster
+
+        The parts of all products are flattened into one array with an
+        owner index and ranked at once by `rank_parts`. With `explain` the
+        sources are needed, and `sort_products` is used instead.
+        """
+        if explain:
+            return self.sort_products(products, keywords, explain)
+
+        parts, counts = self.flatten_parts(products)
+        idx, scores = self.rank_parts(parts, counts, keywords)
+
+        products = [products[i] for i in idx]
+
+        return products, scores, None